@@ -0,0 +1,130 @@
+"""Benchmarks of the Publisher models.
+
+The benchmarks run against a LoopbackRouter so they need no crossbar
+router or network. Every benchmark is run for each container size and
+subscriber count, the results are plain dicts that can be saved as JSON
+and compared with an earlier run to catch regressions.
+
+You can run the benchmarks by writing "python -m autopubpy.benchmarks",
+see "python -m autopubpy.benchmarks --help".
+
+"""
+import json
+import platform
+import time
+import timeit
+from autopubpy._version import __version__
+
+_benchmarks = []
+
+
+def benchmark(func):
+    """Registers a benchmark function.
+
+    The function is called with the keyword arguments size, subscribers
+    and operations and returns the number of operations it timed along
+    with the seconds they took.
+
+    """
+    _benchmarks.append(func)
+    return func
+
+
+def available_benchmarks():
+    """Returns the names of the registered benchmarks."""
+    return [func.__name__ for func in _benchmarks]
+
+
+def run(sizes=(1000, 10000), subscribers=(1, 8), operations=1000, names=None, repeat=3):
+    """Runs the benchmarks.
+
+    Args:
+        sizes (iterable(int)): The container sizes to benchmark.
+        subscribers (iterable(int)): The subscriber counts to benchmark.
+        operations (int): The number of operations each benchmark times.
+        names (iterable(unicode)): The benchmarks to run, all by default.
+        repeat (int): Each benchmark is run this many times and the
+            fastest run is kept.
+
+    Returns:
+        dict: The 'meta' data of the run and a list of 'results', each
+            with the 'name', 'size', 'subscribers', 'operations', 'seconds'
+            and 'ops_per_sec' of one benchmark.
+
+    """
+    results = []
+    for func in _benchmarks:
+        if names and func.__name__ not in names:
+            continue
+        for size in sizes:
+            for subscriber_count in subscribers:
+                timings = [func(size=size, subscribers=subscriber_count, operations=operations)
+                           for _ in xrange(repeat)]
+                count, seconds = min(timings, key=lambda timing: timing[1])
+                results.append({u'name': func.__name__,
+                                u'size': size,
+                                u'subscribers': subscriber_count,
+                                u'operations': count,
+                                u'seconds': seconds,
+                                u'ops_per_sec': count / seconds if seconds else float('inf')})
+    meta = {u'version': __version__,
+            u'python': platform.python_version(),
+            u'platform': platform.platform(),
+            u'time': time.time()}
+    return {u'meta': meta, u'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compares two runs.
+
+    Args:
+        baseline (dict): The results of run for the reference run.
+        current (dict): The results of run to check.
+        threshold (float): The fraction of ops_per_sec a benchmark may
+            lose before it is reported as a regression.
+
+    Returns:
+        list(dict): For every benchmark in both runs, the 'name', 'size',
+            'subscribers', the 'ratio' of current to baseline ops_per_sec
+            and whether it is a 'regression'.
+
+    """
+    def key(result):
+        return result[u'name'], result[u'size'], result[u'subscribers']
+    baseline_results = dict((key(result), result) for result in baseline[u'results'])
+    comparison = []
+    for result in current[u'results']:
+        reference = baseline_results.get(key(result))
+        if reference is None:
+            continue
+        ratio = result[u'ops_per_sec'] / reference[u'ops_per_sec']
+        comparison.append({u'name': result[u'name'],
+                           u'size': result[u'size'],
+                           u'subscribers': result[u'subscribers'],
+                           u'ratio': ratio,
+                           u'regression': ratio < 1.0 - threshold})
+    return comparison
+
+
+def save(results, path):
+    """Writes the results of run to a JSON file."""
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load(path):
+    """Reads the results of run from a JSON file."""
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def timed(func, *args, **kwargs):
+    """Returns the seconds func takes to run."""
+    start = timeit.default_timer()
+    func(*args, **kwargs)
+    return timeit.default_timer() - start
+
+
+# The suites register their benchmarks when imported, they import the
+# functions above so they are imported last.
+import autopubpy.benchmarks.suites  #pylint: disable=wrong-import-position,unused-import
@@ -0,0 +1,48 @@
+"""Runs the benchmarks of autopubpy.
+
+You can run this file by writing "python -m autopubpy.benchmarks"
+"""
+import argparse
+import sys
+import autopubpy.benchmarks as benchmarks
+
+
+def main(argv=None):
+    """Runs the benchmarks, saves or prints the results, and compares
+    them to a baseline.
+
+    Returns:
+        int: 1 if a benchmark regressed compared to the baseline, else 0.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help="The benchmarks to run.")
+    parser.add_argument('--output', help="Save the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare with the results in this JSON file.")
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = benchmarks.run(args.sizes, args.subscribers, args.operations,
+                             args.only, args.repeat)
+    if args.output:
+        benchmarks.save(results, args.output)
+    for result in results[u'results']:
+        print "{name:<16} size={size:<8} subscribers={subscribers:<4} " \
+              "{ops_per_sec:>14.1f} ops/sec".format(**result)
+    if not args.baseline:
+        return 0
+    comparison = benchmarks.compare(benchmarks.load(args.baseline), results, args.threshold)
+    regressed = False
+    for item in comparison:
+        regressed = regressed or item[u'regression']
+        print "{name:<16} size={size:<8} subscribers={subscribers:<4} {ratio:>6.2f}x{flag}".format(
+            flag=" REGRESSION" if item[u'regression'] else "", **item)
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
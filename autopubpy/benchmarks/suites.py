@@ -0,0 +1,145 @@
+"""The benchmarks run by autopubpy.benchmarks.run."""
+import random
+from autopubpy.benchmarks import benchmark, timed
+from autopubpy.loopback import LoopbackRouter
+from autopubpy.models import SyncDict, SyncList
+
+
+class NullSession(object):
+    """A session that accepts every publish and does nothing."""
+
+    def publish(self, topic, *args, **kwargs):
+        pass
+
+
+def replicated(cls, data, subscribers, router=None):
+    """Returns a main instance of cls and the router it is connected to,
+    with subscribers client replicas.
+
+    """
+    router = router or LoopbackRouter()
+    main = cls(data, name=u'benchmark')
+    main.set_main_session(router.session())
+    replicas = []
+    for _ in xrange(subscribers):
+        replica = cls(name=u'benchmark')
+        replica.set_client_session(router.session())
+        replicas.append(replica)
+    main.replicas = replicas
+    return main
+
+
+@benchmark
+def list_insert(size, subscribers, operations):
+    synclist = replicated(SyncList, range(size), subscribers)
+    positions = [random.randint(0, size) for _ in xrange(operations)]
+    def insert_all():
+        for position in positions:
+            synclist.insert(position, position)
+    return operations, timed(insert_all)
+
+
+@benchmark
+def list_setitem(size, subscribers, operations):
+    synclist = replicated(SyncList, range(size), subscribers)
+    positions = [random.randrange(size) for _ in xrange(operations)]
+    def set_all():
+        for position in positions:
+            synclist[position] = -position
+    return operations, timed(set_all)
+
+
+@benchmark
+def list_sort(size, subscribers, operations):
+    synclist = replicated(SyncList, [random.random() for _ in xrange(size)], subscribers)
+    return 1, timed(synclist.sort)
+
+
+@benchmark
+def dict_setitem(size, subscribers, operations):
+    syncdict = replicated(SyncDict, ((unicode(key), key) for key in xrange(size)), subscribers)
+    keys = [unicode(random.randrange(size * 2)) for _ in xrange(operations)]
+    def set_all():
+        for key in keys:
+            syncdict[key] = key
+    return operations, timed(set_all)
+
+
+@benchmark
+def dict_delitem(size, subscribers, operations):
+    syncdict = replicated(SyncDict, ((unicode(key), key) for key in xrange(size)), subscribers)
+    keys = random.sample(list(syncdict), min(size, operations))
+    def delete_all():
+        for key in keys:
+            del syncdict[key]
+    return len(keys), timed(delete_all)
+
+
+def fanned_out(data, subscribers, share_payloads):
+    """Returns a SyncList of data publishing to subscribers NullSessions."""
+    synclist = SyncList(data, name=u'benchmark')
+    synclist.share_payloads = share_payloads
+    synclist.sessions = [NullSession() for _ in xrange(subscribers)]
+    for session in synclist.sessions:
+        synclist.subscribe(session)
+    return synclist
+
+
+def set_small(size, subscribers, operations, share_payloads):
+    synclist = fanned_out(range(size), subscribers, share_payloads)
+    def set_all():
+        for position in xrange(operations):
+            synclist[position % size] = position
+    return operations, timed(set_all)
+
+
+def set_large(size, subscribers, operations, share_payloads):
+    synclist = fanned_out([None], subscribers, share_payloads)
+    value = range(size)
+    def set_all():
+        for _ in xrange(operations):
+            synclist[0] = value
+    return operations, timed(set_all)
+
+
+@benchmark
+def fanout(size, subscribers, operations):
+    return set_small(size, subscribers, operations, False)
+
+
+@benchmark
+def fanout_shared(size, subscribers, operations):
+    return set_small(size, subscribers, operations, True)
+
+
+@benchmark
+def fanout_large(size, subscribers, operations):
+    return set_large(size, subscribers, operations, False)
+
+
+@benchmark
+def fanout_large_shared(size, subscribers, operations):
+    return set_large(size, subscribers, operations, True)
+
+
+@benchmark
+def snapshot_encode(size, subscribers, operations):
+    synclist = SyncList([random.random() for _ in xrange(size)])
+    return 1, timed(synclist.dump_state, u'json')
+
+
+@benchmark
+def snapshot_decode(size, subscribers, operations):
+    synclist = SyncList([random.random() for _ in xrange(size)])
+    payload = synclist.dump_state(u'json')
+    return 1, timed(synclist.load_state, payload, u'json')
+
+
+@benchmark
+def convergence(size, subscribers, operations):
+    def converge():
+        synclist = replicated(SyncList, range(size), subscribers)
+        for position in xrange(operations):
+            synclist.append(position)
+        assert all(len(replica) == len(synclist) for replica in synclist.replicas)
+    return operations, timed(converge)
@@ -0,0 +1,203 @@
+"""This module contains the compression of large Publisher payloads.
+
+Payloads at least as large as a threshold are compressed and wrapped in
+an envelope, a dict with the name of the compressor, so receivers tell
+them from raw payloads, which are always unicode or bytes. Smaller
+payloads are sent as they are.
+
+Compressors are registered by name like codecs. A client lists the
+compressors it accepts when it calls sync_since, so a main session
+never sends an envelope to a client that cannot open it.
+
+Note:
+    Envelopes of unicode payloads carry the compressed bytes base64
+    encoded, so they survive any WAMP serializer. Envelopes of bytes
+    payloads carry raw bytes.
+
+"""
+import base64
+import timeit
+import zlib
+
+
+class Compressor(object):
+    """Base class of a compressor.
+
+    Attributes:
+        name (unicode): The name the compressor is registered under.
+
+    """
+    name = None
+
+    def compress(self, data):
+        """Returns the compressed bytes of data."""
+        raise NotImplementedError("You must impliment compress in a subclass.")
+
+    def decompress(self, data):
+        """Returns the bytes data was compressed from."""
+        raise NotImplementedError("You must impliment decompress in a subclass.")
+
+
+class ZlibCompressor(Compressor):
+    """Compressor using zlib from the standard library.
+
+    Args:
+        level (int): The zlib compression level, 1 is fastest and
+            9 is smallest.
+
+    """
+    name = u'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+_compressors = {}
+
+
+def register_compressor(compressor):
+    """Registers a compressor under its name, replacing any
+    compressor with the same name.
+
+    Args:
+        compressor (Compressor): The compressor instance.
+
+    """
+    if not isinstance(compressor, Compressor):
+        raise TypeError("compressor must be a Compressor not {}.".format(type(compressor)))
+    _compressors[compressor.name] = compressor
+
+
+def get_compressor(name):
+    """Returns the compressor registered under name.
+
+    Raises:
+        ValueError: If no compressor is registered under name.
+
+    """
+    try:
+        return _compressors[name]
+    except KeyError:
+        raise ValueError("No compressor is registered as {!r}.".format(name))
+
+
+def available_compressors():
+    """Returns a sorted list of the registered compressor names."""
+    return sorted(_compressors)
+
+
+def choose_compressor(accept_encodings):
+    """Returns the name of the first registered compressor in
+    accept_encodings, or None if there is none.
+
+    """
+    for name in accept_encodings or ():
+        if name in _compressors:
+            return name
+    return None
+
+
+class CompressionStats(object):
+    """Counts what compressing the payloads of one object saved and cost.
+
+    Attributes:
+        payloads (int): The number of payloads compressed.
+        raw_bytes (int): Their size before compression.
+        compressed_bytes (int): Their size after compression.
+        compress_seconds (float): The time spent compressing.
+        decompress_seconds (float): The time spent decompressing.
+
+    """
+
+    def __init__(self):
+        self.payloads = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+        self.decompress_seconds = 0.0
+
+    @property
+    def ratio(self):
+        """float: The compressed size over the raw size, None until
+        a payload is compressed.
+
+        """
+        if not self.raw_bytes:
+            return None
+        return float(self.compressed_bytes) / self.raw_bytes
+
+    def as_dict(self):
+        """Returns the stats as a dict of plain values."""
+        return {u'payloads': self.payloads,
+                u'raw_bytes': self.raw_bytes,
+                u'compressed_bytes': self.compressed_bytes,
+                u'ratio': self.ratio,
+                u'compress_seconds': self.compress_seconds,
+                u'decompress_seconds': self.decompress_seconds}
+
+
+def pack(payload, encoding, threshold=0, stats=None):
+    """Compresses a payload into an envelope if it is large enough.
+
+    Args:
+        payload (unicode or bytes): The payload to compress.
+        encoding (unicode): The name of the compressor, or None to
+            return the payload as it is.
+        threshold (int): The size in bytes below which payloads are
+            not compressed.
+        stats (CompressionStats): Updated with the saving and the cost.
+
+    Returns:
+        The payload, or a dict envelope of the compressed payload.
+
+    """
+    if encoding is None:
+        return payload
+    text = isinstance(payload, unicode)
+    data = payload.encode('utf-8') if text else payload
+    if len(data) < threshold:
+        return payload
+    start = timeit.default_timer()
+    compressed = get_compressor(encoding).compress(data)
+    if stats is not None:
+        stats.payloads += 1
+        stats.raw_bytes += len(data)
+        stats.compressed_bytes += len(compressed)
+        stats.compress_seconds += timeit.default_timer() - start
+    if text:
+        compressed = base64.b64encode(compressed).decode('ascii')
+    return {u'encoding': encoding, u'text': text, u'data': compressed}
+
+
+def unpack(payload, stats=None):
+    """Returns the payload an envelope returned by pack holds, payloads
+    that are not envelopes are returned as they are and envelopes
+    without an encoding hold their payload uncompressed.
+
+    Raises:
+        ValueError: If the compressor of the envelope is not registered.
+
+    """
+    if not isinstance(payload, dict):
+        return payload
+    if payload.get(u'encoding') is None:
+        return payload[u'data']
+    start = timeit.default_timer()
+    data = payload[u'data']
+    if payload[u'text']:
+        data = base64.b64decode(data)
+    data = get_compressor(payload[u'encoding']).decompress(data)
+    if stats is not None:
+        stats.decompress_seconds += timeit.default_timer() - start
+    if payload[u'text']:
+        return data.decode('utf-8')
+    return data
+
+
+register_compressor(ZlibCompressor())
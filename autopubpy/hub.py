@@ -0,0 +1,159 @@
+"""This module contains PublisherHub, which shares many Publishers
+through one subscription and one procedure.
+
+Each Publisher normally subscribes to its own uri and registers its
+own procedures, so connecting thousands of objects takes thousands of
+round trips. The objects added to a hub publish on the topic of the
+hub instead, with their uri as the 'target' of the event, and their
+state is served by the single sync procedure of the hub.
+
+Example:
+    hub = PublisherHub(u'com.shop')
+    for name in names:
+        hub.add(SyncDict(base_uri=u'com.shop', name=name))
+    hub.set_main_session(session)
+
+"""
+from twisted.internet.defer import inlineCallbacks, returnValue
+from autopubpy.pubsub import Publisher, attach_clients
+
+
+class PublisherHub(object):
+    """Multiplexes the events and state of many Publishers.
+
+    The hub subscribes to <base_uri>.hub and registers <base_uri>.hub.sync.
+    Every session, main or client, must add the same objects to its hub.
+
+    Args:
+        base_uri (unicode): The uri the hub topic and procedure are under.
+
+    """
+
+    def __init__(self, base_uri=u'com'):
+        self.base_uri = base_uri
+        self._publishers = {}
+        self._sessions = []
+        self._main = None
+
+    @property
+    def topic(self):
+        """unicode: The topic every object of the hub publishes on."""
+        return self.base_uri + u'.hub'
+
+    @property
+    def procedure(self):
+        """unicode: The procedure that serves the state of the objects."""
+        return self.topic + u'.' + self.sync.__name__
+
+    def __contains__(self, uri):
+        return uri in self._publishers
+
+    def __getitem__(self, uri):
+        return self._publishers[uri]
+
+    def __iter__(self):
+        return iter(self._publishers.values())
+
+    def __len__(self):
+        return len(self._publishers)
+
+    def add(self, publisher):
+        """Adds a Publisher to the hub, it is routed by its uri.
+
+        Raises:
+            ValueError: If another object with the same uri was added, or
+                the hub is already connected as a client.
+
+        """
+        if not isinstance(publisher, Publisher):
+            raise TypeError("publisher must be a Publisher not {}.".format(type(publisher)))
+        if publisher.uri in self._publishers:
+            raise ValueError("An object with uri {} is already in the hub.".format(publisher.uri))
+        if self._sessions and not self._main:
+            raise ValueError("Cannot add objects after the hub is connected as a client.")
+        publisher._hub = self  #pylint: disable=protected-access
+        self._publishers[publisher.uri] = publisher
+        for session in self._sessions:
+            publisher.subscribe(session)
+            publisher._connected = True  #pylint: disable=protected-access
+
+    def remove(self, publisher):
+        """Removes a Publisher from the hub, it stops publishing."""
+        del self._publishers[publisher.uri]
+        publisher._hub = None  #pylint: disable=protected-access
+        for session in self._sessions:
+            publisher.unsubscribe(session)
+
+    def _receive_event(self, *args, **kwargs):
+        """Routes an event of the hub topic to its target object."""
+        publisher = self._publishers.get(kwargs.pop('target', None))
+        if publisher is not None:
+            publisher._receive_sync_event(*args, **kwargs)  #pylint: disable=protected-access
+
+    def sync(self, versions, accept_encodings=None):
+        """Returns what the replicas of many objects need to catch up.
+
+        This method is registered as an RPC by set_main_session.
+
+        Args:
+            versions (dict): Maps the uri of each object to the last version
+                its replica applied, or None if it was never synced.
+            accept_encodings (list(unicode)): The compressors the client
+                accepts, see Publisher.sync_since.
+
+        Returns:
+            dict: Maps the uri of each known object to its sync_since result.
+
+        """
+        results = {}
+        for uri, version in versions.iteritems():
+            publisher = self._publishers.get(uri)
+            if publisher is not None:
+                result = publisher.sync_since(version, accept_encodings=accept_encodings)
+                results[uri] = publisher._negotiate_encodings(result, accept_encodings)  #pylint: disable=protected-access
+        return results
+
+    @inlineCallbacks
+    def set_main_session(self, session):
+        """Sets the main session of every object in the hub.
+
+        Args:
+            session (ApplicationSession): The twisted session connected
+                to the router.
+
+        """
+        self._main = True
+        for publisher in self._publishers.itervalues():
+            publisher._authoritative = True  #pylint: disable=protected-access
+            publisher.subscribe(session)
+        self._sessions.append(session)
+        yield session.register(self.sync, self.procedure)
+        yield session.subscribe(self._receive_event, self.topic)
+        for publisher in self._publishers.itervalues():
+            publisher._connected = True  #pylint: disable=protected-access
+        returnValue(self)
+
+    def set_client_session(self, session):
+        """Sets a client session of every object in the hub, fetching
+        the state of all of them with one call.
+
+        Args:
+            session (ApplicationSession): The twisted session connected
+                to the router.
+
+        Returns:
+            Deferred(PublisherHub): The hub, once every object is synced.
+
+        """
+        deferred = attach_clients(session, self._publishers.values())
+        deferred.addCallback(lambda _: self)
+        return deferred
+
+    def _client_attached(self, session):
+        """Called by attach_clients once the objects of the hub are
+        synced through a client session.
+
+        """
+        self._main = False
+        if session not in self._sessions:
+            self._sessions.append(session)
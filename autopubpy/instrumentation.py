@@ -0,0 +1,136 @@
+"""This module contains the instrumentation hooks of Publisher.
+
+A Publisher reports what it does to its instrumentation attribute.
+The default, null_instrumentation, ignores everything and is checked
+through its enabled attribute so the hot path skips timing entirely.
+Failures are reported whether enabled is set or not, and are logged
+with the autopubpy.instrumentation logger unless failure is
+reimplemented. Assign a MemoryCollector to a Publisher (or a Publisher
+subclass) to collect the metrics in memory and scrape them.
+
+Counters:
+    publishes: Events successfully handed to a session.
+    publish_failures: Events a session failed to publish.
+    transport_lost: The publish failures caused by TransportLost.
+    events_applied: Events received from other sessions and applied.
+    resyncs: Catch ups of a client that lost events.
+    bytes: Size of the state payloads sent to clients.
+
+Histograms (seconds):
+    apply_seconds: Running a method_publish method locally.
+    fanout_seconds: Publishing one event to every subscriber.
+
+"""
+import bisect
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation(object):
+    """Instrumentation that ignores everything.
+
+    Subclass this object and set enabled to True to receive metrics.
+
+    Attributes:
+        enabled (bool): If False, Publisher does not time operations
+            or report them.
+
+    """
+    enabled = False
+
+    def count(self, name, value=1):
+        """Adds value to the counter called name."""
+        pass
+
+    def observe(self, name, seconds):
+        """Records a duration in the histogram called name."""
+        pass
+
+    def failure(self, name, error):
+        """Reports an error Publisher handled instead of raising, called
+        from the except block that caught it.
+
+        Args:
+            name (str): The counter the failure is counted in.
+            error (Exception): The error that was caught.
+
+        """
+        logger.warning("%s: %r", name, error, exc_info=True)
+
+
+null_instrumentation = Instrumentation()
+
+
+class Histogram(object):
+    """A fixed bucket histogram of durations.
+
+    Args:
+        buckets (sequence(float)): The sorted upper bounds of the buckets,
+            durations above the last bound are counted in an overflow bucket.
+
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        """Records a duration."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def as_dict(self):
+        """Returns the histogram as a dict of plain values."""
+        return {u'buckets': list(self.buckets),
+                u'counts': list(self.counts),
+                u'count': self.count,
+                u'sum': self.total}
+
+
+class MemoryCollector(Instrumentation):
+    """Instrumentation that keeps counters and histograms in memory.
+
+    Args:
+        buckets (sequence(float)): The upper bounds used for every histogram.
+
+    """
+    enabled = True
+    default_buckets = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.default_buckets)
+        self.counters = collections.Counter()
+        self.histograms = {}
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, seconds):
+        try:
+            histogram = self.histograms[name]
+        except KeyError:
+            histogram = self.histograms[name] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def scrape(self, reset=False):
+        """Returns every metric collected so far.
+
+        Args:
+            reset (bool): If True the metrics are cleared afterwards.
+
+        Returns:
+            dict: The 'counters' and 'histograms' by name.
+
+        """
+        metrics = {u'counters': dict(self.counters),
+                   u'histograms': dict((name, histogram.as_dict())
+                                       for name, histogram in self.histograms.iteritems())}
+        if reset:
+            self.counters.clear()
+            self.histograms.clear()
+        return metrics
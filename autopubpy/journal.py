@@ -0,0 +1,256 @@
+"""This module contains the on-disk journal of a main session Publisher.
+
+A Journal appends every operation the main session versions to a file
+and periodically compacts them into a snapshot of the state, so a
+restarted main session restores the state and its version instead of
+starting empty. The operation log is repopulated from the journal, so
+clients that reconnect after the restart only fetch the operations
+they missed.
+
+Files:
+    <path>.snapshot: A header with the version and codec name, followed
+        by the dump_state payload of that version.
+    <path>.journal: A header followed by records, each the length of
+        the record as 4 little endian bytes and an encoded
+        [version, op, args] list, followed by the origin token of
+        the operations made by a client.
+
+Both files are read through mmap, a record cut short by a crash is
+discarded when the journal is restored.
+
+Example:
+    journal = Journal('/var/lib/shop/colors')
+    colors = SyncList(name=u'colors')
+    journal.attach(colors)
+    colors.set_main_session(session)
+
+"""
+import contextlib
+import mmap
+import os
+import struct
+from autopubpy.serialization import get_codec
+
+_SNAPSHOT_MAGIC = b'APSNAP1\n'
+_JOURNAL_MAGIC = b'APJRNL1\n'
+_snapshot_header = struct.Struct('<QH')
+_record_header = struct.Struct('<I')
+
+
+def _to_bytes(payload):
+    if isinstance(payload, unicode):
+        return payload.encode('utf-8')
+    return payload
+
+
+def _from_bytes(codec, data):
+    if codec.binary:
+        return data
+    return data.decode('utf-8')
+
+
+@contextlib.contextmanager
+def _mapped(path):
+    """Yields a read only mmap of a file, or None if the file does
+    not exist or is empty.
+
+    """
+    try:
+        handle = open(path, 'rb')
+    except IOError:
+        yield None
+        return
+    with handle:
+        size = os.fstat(handle.fileno()).st_size
+        if not size:
+            yield None
+            return
+        mapped = mmap.mmap(handle.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def _replace(source, destination):
+    """Renames source to destination, replacing it."""
+    if os.name == 'nt' and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+
+class Journal(object):
+    """Append-only journal and compacted snapshot of one Publisher.
+
+    Args:
+        path (str): The path the '.journal' and '.snapshot' files
+            are written to.
+        compact_every (int): The number of records after which the
+            journal is compacted into a new snapshot, or None to only
+            compact when compact is called.
+        fsync (bool): If True every record is flushed to the disk
+            before the operation is published, otherwise records are
+            left to the operating system.
+        codec (unicode): The codec of the records, defaults to the
+            codec of the publisher.
+
+    Attributes:
+        restored_version (int): The version restored by attach, None if
+            there was nothing to restore.
+        records (int): The number of records in the journal file.
+
+    """
+
+    def __init__(self, path, compact_every=10000, fsync=False, codec=None):
+        self.path = path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.codec = codec
+        self.restored_version = None
+        self.records = 0
+        self._publisher = None
+        self._file = None
+
+    @property
+    def journal_path(self):
+        """str: The path of the journal file."""
+        return self.path + '.journal'
+
+    @property
+    def snapshot_path(self):
+        """str: The path of the snapshot file."""
+        return self.path + '.snapshot'
+
+    def attach(self, publisher):
+        """Restores the publisher from the files and then journals
+        every operation it versions.
+
+        Call this before set_main_session, which does not broadcast the
+        state of a restored publisher since clients already have it.
+
+        Args:
+            publisher (Publisher): The main session object.
+
+        Returns:
+            int: The restored version, or None if there was nothing
+                to restore.
+
+        """
+        if self._publisher is not None:
+            raise ValueError("The journal is already attached to {}.".format(self._publisher.uri))
+        if self.codec is None:
+            self.codec = publisher.codec
+        self._publisher = publisher
+        self.restored_version = self._restore(publisher)
+        empty = not os.path.exists(self.journal_path) or not os.path.getsize(self.journal_path)
+        self._file = open(self.journal_path, 'ab')
+        if empty:
+            self._file.write(_JOURNAL_MAGIC)
+            self._flush()
+        publisher._journal = self  #pylint: disable=protected-access
+        return self.restored_version
+
+    def _restore(self, publisher):
+        """Loads the snapshot and replays the journal records after it."""
+        restored = None
+        with _mapped(self.snapshot_path) as data:
+            if data is not None:
+                offset = len(_SNAPSHOT_MAGIC)
+                if data[:offset] != _SNAPSHOT_MAGIC:
+                    raise ValueError("{} is not a snapshot file.".format(self.snapshot_path))
+                version, name_size = _snapshot_header.unpack_from(data, offset)
+                offset += _snapshot_header.size
+                codec_name = data[offset:offset + name_size].decode('utf-8')
+                offset += name_size
+                codec = get_codec(codec_name)
+                publisher.load_state(_from_bytes(codec, data[offset:]), codec_name)
+                publisher._version = restored = version  #pylint: disable=protected-access
+                publisher._oplog.clear()  #pylint: disable=protected-access
+
+        with _mapped(self.journal_path) as data:
+            if data is None:
+                return restored
+            offset = end = len(_JOURNAL_MAGIC)
+            if data[:offset] != _JOURNAL_MAGIC:
+                raise ValueError("{} is not a journal file.".format(self.journal_path))
+            codec = get_codec(self.codec)
+            with publisher.block_propagation():
+                while offset + _record_header.size <= len(data):
+                    size, = _record_header.unpack_from(data, offset)
+                    start = offset + _record_header.size
+                    if start + size > len(data):
+                        break
+                    record = codec.decode(_from_bytes(codec, data[start:start + size]))
+                    version, op, args = record[:3]
+                    offset = end = start + size
+                    self.records += 1
+                    if restored is not None and version <= restored:
+                        continue
+                    publisher._call_op(op, args)  #pylint: disable=protected-access
+                    publisher._version = restored = version  #pylint: disable=protected-access
+                    publisher._oplog.append(tuple(record))  #pylint: disable=protected-access
+            size = len(data)
+        if end < size:
+            with open(self.journal_path, 'r+b') as handle:
+                handle.truncate(end)
+        return restored
+
+    def append(self, version, op, args, origin=None):
+        """Appends the record of a versioned operation, and the origin
+        token of the client that made it if there is one.
+
+        A full state load is not journaled, the journal is compacted
+        into a snapshot of the new state instead.
+
+        """
+        if op == self._publisher._op_codes['load_state']:  #pylint: disable=protected-access
+            self.compact()
+            return
+        record = [version, op, list(args)]
+        if origin is not None:
+            record.append(origin)
+        record = _to_bytes(get_codec(self.codec).encode(record))
+        self._file.write(_record_header.pack(len(record)) + record)
+        self._flush()
+        self.records += 1
+        if self.compact_every is not None and self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Writes a snapshot of the current state and empties the journal.
+
+        The snapshot is written to a temporary file first and renamed
+        over the previous one, so a crash leaves one complete snapshot.
+
+        """
+        publisher = self._publisher
+        name = publisher.codec
+        encoded_name = name.encode('utf-8')
+        temporary = self.snapshot_path + '.tmp'
+        with open(temporary, 'wb') as handle:
+            handle.write(_SNAPSHOT_MAGIC)
+            handle.write(_snapshot_header.pack(publisher.version, len(encoded_name)))
+            handle.write(encoded_name)
+            handle.write(_to_bytes(publisher.snapshot(name)))
+            handle.flush()
+            os.fsync(handle.fileno())
+        _replace(temporary, self.snapshot_path)
+        self._file.close()
+        self._file = open(self.journal_path, 'wb')
+        self._file.write(_JOURNAL_MAGIC)
+        self._flush()
+        self.records = 0
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Stops journaling and closes the journal file."""
+        if self._publisher is not None:
+            self._publisher._journal = None  #pylint: disable=protected-access
+            self._publisher = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
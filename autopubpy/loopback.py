@@ -0,0 +1,238 @@
+"""This module contains an in-process stand-in for a WAMP router.
+
+LoopbackRouter and LoopbackSession implement the publish, subscribe,
+register and call surface Publisher uses, so replication between many
+sessions can be tested and benchmarked in a single process without a
+crossbar router or a network.
+
+Like a real router, every payload is serialized and unserialized on
+its way between sessions, so sessions never share objects, and a
+session does not receive its own events unless exclude_me is False.
+
+Example:
+    router = LoopbackRouter()
+    main_list = SyncList(name=u'colors')
+    main_list.set_main_session(router.session())
+    client_list = SyncList(name=u'colors')
+    client_list.set_client_session(router.session())
+
+"""
+import collections
+import itertools
+import random
+from autobahn.wamp.exception import ApplicationError, TransportLost
+from autobahn.wamp.message import check_or_raise_uri
+from autobahn.wamp.serializer import JsonObjectSerializer
+from autobahn.wamp.types import PublishOptions, SubscribeOptions
+from twisted.internet import task
+from twisted.internet.defer import maybeDeferred, succeed
+
+
+class LoopbackRouter(object):
+    """Routes events and calls between LoopbackSessions.
+
+    Args:
+        latency (float): Seconds every event and call is delayed by, or
+            None to deliver synchronously.
+        drop_rate (float): The probability an event is dropped instead
+            of delivered to a subscriber.
+        seed (int): The seed used to choose which events are dropped.
+        clock (IReactorTime): The clock used for latency, the twisted
+            reactor by default. Use twisted.internet.task.Clock in tests.
+        serializer (Serializer): The autobahn object serializer payloads
+            go through, JSON by default.
+
+    Attributes:
+        published (int): The number of events published.
+        delivered (int): The number of events delivered to a handler.
+        dropped (int): The number of events dropped.
+        calls (Counter): The number of calls of each procedure.
+        errors (list(Exception)): The exceptions raised by event handlers,
+            a real router would only log these.
+
+    """
+
+    def __init__(self, latency=None, drop_rate=0.0, seed=None, clock=None, serializer=None):
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._serializer = JsonObjectSerializer() if serializer is None else serializer
+        self._session_ids = itertools.count(1)
+        self._subscriptions = []
+        self._registrations = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.calls = collections.Counter()
+        self.errors = []
+
+    @property
+    def clock(self):
+        """IReactorTime: The clock used to delay messages."""
+        if self._clock is None:
+            from twisted.internet import reactor
+            self._clock = reactor
+        return self._clock
+
+    def session(self):
+        """Returns a new LoopbackSession attached to this router."""
+        return LoopbackSession(self, next(self._session_ids))
+
+    def detach(self, session):
+        """Removes the subscriptions and registrations of a session."""
+        for subscription in self._subscriptions:
+            if subscription.session is session:
+                subscription.active = False
+        self._subscriptions = [subscription for subscription in self._subscriptions
+                               if subscription.active]
+        for procedure, (owner, _) in self._registrations.items():
+            if owner is session:
+                del self._registrations[procedure]
+
+    def _copy(self, args, kwargs):
+        """Returns args and kwargs after a trip through the serializer."""
+        payload = self._serializer.serialize([list(args), kwargs])
+        args, kwargs = self._serializer.unserialize(payload)[0]
+        return args, kwargs
+
+    def _later(self, func, *args, **kwargs):
+        """Runs func after the latency and returns a Deferred of the result."""
+        if self.latency is None:
+            return maybeDeferred(func, *args, **kwargs)
+        return task.deferLater(self.clock, self.latency, func, *args, **kwargs)
+
+    def _publish(self, publisher, topic, args, kwargs, options):
+        self.published += 1
+        exclude_me = options.exclude_me is None or options.exclude_me
+        for subscription in list(self._subscriptions):
+            receiver = subscription.session
+            if receiver is publisher and exclude_me:
+                continue
+            if options.eligible is not None and receiver.session_id not in options.eligible:
+                continue
+            if options.exclude is not None and receiver.session_id in options.exclude:
+                continue
+            if not subscription.matches(topic):
+                continue
+            if self.drop_rate and self._random.random() < self.drop_rate:
+                self.dropped += 1
+                continue
+            event_args, event_kwargs = self._copy(args, kwargs)
+            if self.latency is None:
+                self._deliver(subscription, event_args, event_kwargs)
+            else:
+                self.clock.callLater(self.latency, self._deliver, subscription,
+                                     event_args, event_kwargs)
+
+    def _deliver(self, subscription, args, kwargs):
+        if not subscription.active:
+            return
+        self.delivered += 1
+        try:
+            subscription.handler(*args, **kwargs)
+        except Exception as e:  #pylint: disable=broad-except
+            self.errors.append(e)
+
+    def _call(self, procedure, args, kwargs):
+        try:
+            _, endpoint = self._registrations[procedure]
+        except KeyError:
+            raise ApplicationError(ApplicationError.NO_SUCH_PROCEDURE,
+                                   "No procedure registered as {}.".format(procedure))
+        self.calls[procedure] += 1
+        args, kwargs = self._copy(args, kwargs)
+        deferred = self._later(endpoint, *args, **kwargs)
+        deferred.addCallback(lambda result: self._copy([result], {})[0][0])
+        return deferred
+
+
+class _Subscription(object):
+    """A subscription of a LoopbackSession, returned by subscribe."""
+
+    def __init__(self, session, handler, topic, match):
+        self.session = session
+        self.handler = handler
+        self.topic = topic
+        self.match = match
+        self.active = True
+
+    def matches(self, topic):
+        if self.match == u'prefix':
+            return topic.startswith(self.topic)
+        return topic == self.topic
+
+    def unsubscribe(self):
+        """Stops delivering events to the handler."""
+        self.active = False
+        router = self.session.router
+        router._subscriptions = [subscription for subscription in router._subscriptions  #pylint: disable=protected-access
+                                 if subscription is not self]
+        return succeed(None)
+
+
+class LoopbackSession(object):
+    """A fake ApplicationSession connected to a LoopbackRouter.
+
+    Only the parts of the session interface Publisher uses are
+    implemented. Call leave to simulate a lost connection.
+
+    """
+
+    def __init__(self, router, session_id):
+        self.router = router
+        self.session_id = session_id
+        self.connected = True
+
+    def _check_connected(self):
+        if not self.connected:
+            raise TransportLost()
+
+    def publish(self, topic, *args, **kwargs):
+        """Publishes an event, see ApplicationSession.publish.
+
+        Raises:
+            ProtocolError: If topic is not a valid URI, which a router
+                would reject.
+
+        """
+        self._check_connected()
+        check_or_raise_uri(topic, u"Invalid topic")
+        options = kwargs.pop('options', None) or PublishOptions()
+        self.router._publish(self, topic, args, kwargs, options)  #pylint: disable=protected-access
+        if options.acknowledge:
+            return succeed(None)
+
+    def subscribe(self, handler, topic, options=None):
+        """Subscribes handler to topic, see ApplicationSession.subscribe."""
+        self._check_connected()
+        options = options or SubscribeOptions()
+        subscription = _Subscription(self, handler, topic, options.match or u'exact')
+        self.router._subscriptions.append(subscription)  #pylint: disable=protected-access
+        return succeed(subscription)
+
+    def register(self, endpoint, procedure, options=None):  #pylint: disable=unused-argument
+        """Registers endpoint as procedure, see ApplicationSession.register."""
+        self._check_connected()
+        registrations = self.router._registrations  #pylint: disable=protected-access
+        if procedure in registrations:
+            raise ApplicationError(ApplicationError.PROCEDURE_ALREADY_EXISTS,
+                                   "A procedure is already registered as {}.".format(procedure))
+        registrations[procedure] = (self, endpoint)
+        return succeed(procedure)
+
+    def call(self, procedure, *args, **kwargs):
+        """Calls a registered procedure, see ApplicationSession.call.
+
+        Returns:
+            Deferred: The result of the procedure.
+
+        """
+        self._check_connected()
+        kwargs.pop('options', None)
+        return maybeDeferred(self.router._call, procedure, args, kwargs)  #pylint: disable=protected-access
+
+    def leave(self):
+        """Disconnects the session from the router."""
+        self.connected = False
+        self.router.detach(self)
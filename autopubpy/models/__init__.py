@@ -1,2 +1,6 @@
 from synclist import SyncList
-from syncdict import SyncDict, SyncOrderedDict
\ No newline at end of file
+from syncdict import SyncDict, SyncOrderedDict
+from syncarray import SyncArray
+from shardeddict import ShardedSyncDict
+from synccounter import SyncCounter
+from syncset import SyncSet
\ No newline at end of file
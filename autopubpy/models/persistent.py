@@ -0,0 +1,552 @@
+"""This module contains persistent containers for the list_factory
+and dict_factory of SyncList and SyncDict.
+
+PersistentVector and PersistentMap are used like list and dict, but
+freeze returns a read only version of the container in constant time.
+The frozen version shares its structure with the live container, which
+copies only the parts it changes afterwards, so old versions stay
+readable while the live one keeps changing. Models encode frozen
+versions when they snapshot off the reactor, and diff compares two
+versions by skipping the structure they share.
+
+PersistentVector is a list of chunks of at most 2 * chunk_size items,
+PersistentMap is a hash array mapped trie.
+
+Example:
+    colors = SyncList(list_factory=PersistentVector)
+    before = colors._container.freeze()
+    colors.append(u'red')
+    diff(before, colors._container.freeze())  # (0, 0, [u'red'])
+
+"""
+import bisect
+import collections
+import itertools
+
+
+class _Chunk(list):
+    """A chunk of a vector, only mutated by the vector that owns it."""
+    __slots__ = ('owner',)
+
+    def __init__(self, items=(), owner=None):
+        super(_Chunk, self).__init__(items)
+        self.owner = owner
+
+
+class _VectorBase(collections.Sequence):
+    """The read only operations of the vectors."""
+
+    def _locate(self, index):
+        """Returns the chunk and the offset in it of an item index."""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("vector index out of range")
+        chunk_index = bisect.bisect_right(self._ends, index)
+        start = self._ends[chunk_index - 1] if chunk_index else 0
+        return chunk_index, index - start
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        chunk_index, offset = self._locate(index)
+        return self._chunks[chunk_index][offset]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._chunks)
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Sequence):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+
+class FrozenVector(_VectorBase):
+    """A read only version of a PersistentVector, returned by freeze."""
+
+    def __init__(self, chunks=(), ends=()):
+        self._chunks = chunks
+        self._ends = ends
+
+    def thaw(self):
+        """Returns a PersistentVector of this version in constant time."""
+        return PersistentVector(self)
+
+
+class PersistentVector(_VectorBase, collections.MutableSequence):
+    """A list that freezes into read only versions in constant time.
+
+    Changing an item copies its chunk and the list of chunks the first
+    time after a freeze, afterwards they are changed in place.
+
+    Args:
+        iterable (iterable): The items of the vector, a FrozenVector
+            or PersistentVector is shared instead of copied.
+
+    """
+    chunk_size = 64
+
+    def __init__(self, iterable=()):
+        self._token = object()
+        if isinstance(iterable, PersistentVector):
+            iterable = iterable.freeze()
+        if isinstance(iterable, FrozenVector):
+            self._chunks = iterable._chunks  #pylint: disable=protected-access
+            self._ends = iterable._ends  #pylint: disable=protected-access
+            self._spine_owner = None
+        else:
+            self._reset(iterable)
+
+    def _reset(self, items):
+        """Replaces the items with new chunks."""
+        items = list(items)
+        size = self.chunk_size
+        self._chunks = [_Chunk(items[start:start + size], self._token)
+                        for start in xrange(0, len(items), size)]
+        self._ends = [min(start + size, len(items)) for start in xrange(0, len(items), size)]
+        self._spine_owner = self._token
+
+    def _own_spine(self):
+        if self._spine_owner is not self._token:
+            self._chunks = list(self._chunks)
+            self._ends = list(self._ends)
+            self._spine_owner = self._token
+
+    def _own_chunk(self, chunk_index):
+        chunk = self._chunks[chunk_index]
+        if chunk.owner is not self._token:
+            self._own_spine()
+            chunk = self._chunks[chunk_index] = _Chunk(chunk, self._token)
+        return chunk
+
+    def _shift_ends(self, chunk_index, delta):
+        ends = self._ends
+        for index in xrange(chunk_index, len(ends)):
+            ends[index] += delta
+
+    def freeze(self):
+        """Returns a read only version of the vector in constant time."""
+        frozen = FrozenVector(self._chunks, self._ends)
+        self._token = object()
+        return frozen
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            items = list(self)
+            items[index] = value
+            self._reset(items)
+            return
+        chunk_index, offset = self._locate(index)
+        self._own_chunk(chunk_index)[offset] = value
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            items = list(self) if index != slice(None) else []
+            del items[index]
+            self._reset(items)
+            return
+        chunk_index, offset = self._locate(index)
+        chunk = self._own_chunk(chunk_index)
+        del chunk[offset]
+        self._own_spine()
+        if chunk:
+            self._shift_ends(chunk_index, -1)
+        else:
+            del self._chunks[chunk_index]
+            del self._ends[chunk_index]
+            self._shift_ends(chunk_index, -1)
+
+    def insert(self, index, value):
+        size = len(self)
+        if index < 0:
+            index = max(index + size, 0)
+        index = min(index, size)
+        if not self._chunks:
+            self._reset([value])
+            return
+        if index == size:
+            chunk_index = len(self._chunks) - 1
+            offset = len(self._chunks[chunk_index])
+        else:
+            chunk_index, offset = self._locate(index)
+        chunk = self._own_chunk(chunk_index)
+        chunk.insert(offset, value)
+        self._own_spine()
+        self._shift_ends(chunk_index, 1)
+        if len(chunk) > 2 * self.chunk_size:
+            half = len(chunk) // 2
+            tail = _Chunk(chunk[half:], self._token)
+            del chunk[half:]
+            self._chunks.insert(chunk_index + 1, tail)
+            self._ends.insert(chunk_index, self._ends[chunk_index] - len(tail))
+
+    def extend(self, values):
+        values = list(values)
+        if not values:
+            return
+        if not self._chunks:
+            self._reset(values)
+            return
+        size = self.chunk_size
+        last = len(self._chunks) - 1
+        room = max(2 * size - len(self._chunks[last]), 0)
+        if room:
+            self._own_chunk(last).extend(values[:room])
+            self._own_spine()
+            self._shift_ends(last, len(values[:room]))
+        self._own_spine()
+        for start in xrange(room, len(values), size):
+            chunk = _Chunk(values[start:start + size], self._token)
+            self._chunks.append(chunk)
+            self._ends.append(self._ends[-1] + len(chunk))
+
+    def reverse(self):
+        self._reset(reversed(list(self)))
+
+    def sort(self, *args, **kwargs):
+        """Sorts the items like list.sort."""
+        items = list(self)
+        items.sort(*args, **kwargs)
+        self._reset(items)
+
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+
+
+def _hash(key):
+    return hash(key) & 0xffffffff
+
+
+def _index(bitmap, bit):
+    return bin(bitmap & (bit - 1)).count('1')
+
+
+class _Node(object):
+    """A node of the trie, only mutated by the map that owns it.
+
+    Its entries are leaves, (key, value, hash) tuples, nodes or
+    collisions, one for every bit set in bitmap.
+
+    """
+    __slots__ = ('bitmap', 'entries', 'owner')
+
+    def __init__(self, bitmap, entries, owner):
+        self.bitmap = bitmap
+        self.entries = entries
+        self.owner = owner
+
+
+class _Collision(object):
+    """The leaves of keys with the same hash."""
+    __slots__ = ('hash', 'leaves', 'owner')
+
+    def __init__(self, hash_, leaves, owner):
+        self.hash = hash_
+        self.leaves = leaves
+        self.owner = owner
+
+
+def _editable(node, token):
+    if node.owner is token:
+        return node
+    return _Node(node.bitmap, list(node.entries), token)
+
+
+def _entry_hash(entry):
+    return entry[2] if type(entry) is tuple else entry.hash
+
+
+def _merge(first, second, shift, token):
+    """Returns the entry holding a leaf, or a collision, and a leaf
+    of another key.
+
+    """
+    first_hash, second_hash = _entry_hash(first), _entry_hash(second)
+    if first_hash == second_hash:
+        return _Collision(first_hash, [first, second], token)
+    first_bits = (first_hash >> shift) & _MASK
+    second_bits = (second_hash >> shift) & _MASK
+    if first_bits == second_bits:
+        return _Node(1 << first_bits, [_merge(first, second, shift + _BITS, token)], token)
+    if first_bits > second_bits:
+        first, second = second, first
+    return _Node((1 << first_bits) | (1 << second_bits), [first, second], token)
+
+
+def _find(node, hash_, key):
+    shift = 0
+    while True:
+        bit = 1 << ((hash_ >> shift) & _MASK)
+        if not node.bitmap & bit:
+            raise KeyError(key)
+        entry = node.entries[_index(node.bitmap, bit)]
+        if type(entry) is tuple:
+            if entry[0] == key:
+                return entry[1]
+            raise KeyError(key)
+        if type(entry) is _Collision:
+            for leaf in entry.leaves:
+                if leaf[0] == key:
+                    return leaf[1]
+            raise KeyError(key)
+        node = entry
+        shift += _BITS
+
+
+def _assoc(node, shift, leaf, token):
+    """Returns the node with leaf set and True if the key is new."""
+    bit = 1 << ((leaf[2] >> shift) & _MASK)
+    index = _index(node.bitmap, bit)
+    if not node.bitmap & bit:
+        node = _editable(node, token)
+        node.entries.insert(index, leaf)
+        node.bitmap |= bit
+        return node, True
+    entry = node.entries[index]
+    added = False
+    if type(entry) is tuple:
+        if entry[0] == leaf[0]:
+            if entry[1] is leaf[1]:
+                return node, False
+            new_entry = leaf
+        else:
+            new_entry, added = _merge(entry, leaf, shift + _BITS, token), True
+    elif type(entry) is _Collision and entry.hash != leaf[2]:
+        new_entry, added = _merge(entry, leaf, shift + _BITS, token), True
+    elif type(entry) is _Collision:
+        leaves = [old for old in entry.leaves if old[0] != leaf[0]]
+        added = len(leaves) == len(entry.leaves)
+        new_entry = _Collision(entry.hash, leaves + [leaf], token)
+    else:
+        new_entry, added = _assoc(entry, shift + _BITS, leaf, token)
+        if new_entry is entry:
+            return node, added
+    node = _editable(node, token)
+    node.entries[index] = new_entry
+    return node, added
+
+
+def _dissoc(node, shift, hash_, key, token):
+    """Returns the node without key, or None if it is empty, and
+    True if the key was found.
+
+    """
+    bit = 1 << ((hash_ >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node, False
+    index = _index(node.bitmap, bit)
+    entry = node.entries[index]
+    if type(entry) is tuple:
+        if entry[0] != key:
+            return node, False
+        new_entry = None
+    elif type(entry) is _Collision:
+        leaves = [leaf for leaf in entry.leaves if leaf[0] != key]
+        if len(leaves) == len(entry.leaves):
+            return node, False
+        new_entry = leaves[0] if len(leaves) == 1 else _Collision(entry.hash, leaves, token)
+    else:
+        new_entry, removed = _dissoc(entry, shift + _BITS, hash_, key, token)
+        if not removed:
+            return node, False
+        if new_entry is entry:
+            return node, True
+        if (type(new_entry) is _Node and len(new_entry.entries) == 1
+                and type(new_entry.entries[0]) is not _Node):
+            new_entry = new_entry.entries[0]
+    if new_entry is None and len(node.entries) == 1:
+        return None, True
+    node = _editable(node, token)
+    if new_entry is None:
+        del node.entries[index]
+        node.bitmap &= ~bit
+    else:
+        node.entries[index] = new_entry
+    return node, True
+
+
+def _leaves(entry):
+    """Yields the leaves under an entry of the trie."""
+    if type(entry) is tuple:
+        yield entry
+    elif type(entry) is _Collision:
+        for leaf in entry.leaves:
+            yield leaf
+    else:
+        for child in entry.entries:
+            for leaf in _leaves(child):
+                yield leaf
+
+
+class _MapBase(collections.Mapping):
+    """The read only operations of the maps."""
+
+    def __getitem__(self, key):
+        return _find(self._root, _hash(key), key)
+
+    def __contains__(self, key):
+        try:
+            _find(self._root, _hash(key), key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (leaf[0] for leaf in _leaves(self._root))
+
+    def iteritems(self):
+        return ((leaf[0], leaf[1]) for leaf in _leaves(self._root))
+
+    def itervalues(self):
+        return (leaf[1] for leaf in _leaves(self._root))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self.iteritems()))
+
+
+class FrozenMap(_MapBase):
+    """A read only version of a PersistentMap, returned by freeze."""
+
+    def __init__(self, root=None, size=0):
+        self._root = _Node(0, [], None) if root is None else root
+        self._size = size
+
+    def thaw(self):
+        """Returns a PersistentMap of this version in constant time."""
+        return PersistentMap(self)
+
+
+class PersistentMap(_MapBase, collections.MutableMapping):
+    """A dict that freezes into read only versions in constant time.
+
+    Changing a key copies the path of trie nodes to it the first time
+    after a freeze, afterwards they are changed in place.
+
+    Args:
+        data (iterable): The items of the map, a FrozenMap or
+            PersistentMap is shared instead of copied.
+
+    """
+
+    def __init__(self, data=(), **kwargs):
+        self._token = object()
+        if isinstance(data, PersistentMap):
+            data = data.freeze()
+        if isinstance(data, FrozenMap):
+            self._root = data._root  #pylint: disable=protected-access
+            self._size = len(data)
+        else:
+            self._root = _Node(0, [], self._token)
+            self._size = 0
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    def freeze(self):
+        """Returns a read only version of the map in constant time."""
+        frozen = FrozenMap(self._root, self._size)
+        self._token = object()
+        return frozen
+
+    def __setitem__(self, key, value):
+        self._root, added = _assoc(self._root, 0, (key, value, _hash(key)), self._token)
+        if added:
+            self._size += 1
+
+    def __delitem__(self, key):
+        root, removed = _dissoc(self._root, 0, _hash(key), key, self._token)
+        if not removed:
+            raise KeyError(key)
+        self._root = _Node(0, [], self._token) if root is None else root
+        self._size -= 1
+
+    def clear(self):
+        self._root = _Node(0, [], self._token)
+        self._size = 0
+
+
+def _diff_entries(old, new, changed, removed):
+    if old is new:
+        return
+    if type(old) is _Node and type(new) is _Node:
+        for bits in xrange(1 << _BITS):
+            bit = 1 << bits
+            if not (old.bitmap | new.bitmap) & bit:
+                continue
+            old_entry = old.entries[_index(old.bitmap, bit)] if old.bitmap & bit else None
+            new_entry = new.entries[_index(new.bitmap, bit)] if new.bitmap & bit else None
+            _diff_entries(old_entry, new_entry, changed, removed)
+        return
+    old_items = dict((leaf[0], leaf[1]) for leaf in _leaves(old)) if old is not None else {}
+    for leaf in _leaves(new) if new is not None else ():
+        key, value = leaf[0], leaf[1]
+        if key not in old_items or (old_items[key] is not value and old_items[key] != value):
+            changed[key] = value
+    new_keys = set(leaf[0] for leaf in _leaves(new)) if new is not None else set()
+    removed.extend(key for key in old_items if key not in new_keys)
+
+
+def diff(old, new):
+    """Returns the changes between two versions of a container.
+
+    Only the chunks or trie nodes the versions do not share are compared,
+    so the cost grows with the size of the change, not of the container.
+
+    Args:
+        old (FrozenVector or FrozenMap): The earlier version.
+        new (FrozenVector or FrozenMap): The later version.
+
+    Returns:
+        For vectors, (start, stop, items), new is old with old[start:stop]
+        replaced by items. For maps, (changed, removed), a dict of the
+        keys added or changed and a list of the keys removed.
+
+    """
+    if isinstance(old, _MapBase) and isinstance(new, _MapBase):
+        changed, removed = {}, []
+        _diff_entries(old._root, new._root, changed, removed)  #pylint: disable=protected-access
+        return changed, removed
+    if not (isinstance(old, _VectorBase) and isinstance(new, _VectorBase)):
+        raise TypeError("diff compares two vectors or two maps.")
+    old_chunks, new_chunks = old._chunks, new._chunks  #pylint: disable=protected-access
+    head = 0
+    while (head < len(old_chunks) and head < len(new_chunks)
+           and old_chunks[head] is new_chunks[head]):
+        head += 1
+    tail = 0
+    while (tail < len(old_chunks) - head and tail < len(new_chunks) - head
+           and old_chunks[-1 - tail] is new_chunks[-1 - tail]):
+        tail += 1
+    start = old._ends[head - 1] if head else 0  #pylint: disable=protected-access
+    old_items = list(itertools.chain.from_iterable(old_chunks[head:len(old_chunks) - tail]))
+    new_items = list(itertools.chain.from_iterable(new_chunks[head:len(new_chunks) - tail]))
+    same = 0
+    while same < len(old_items) and same < len(new_items) and old_items[same] == new_items[same]:
+        same += 1
+    end = 0
+    while (end < len(old_items) - same and end < len(new_items) - same
+           and old_items[-1 - end] == new_items[-1 - end]):
+        end += 1
+    return (start + same, start + len(old_items) - end,
+            new_items[same:len(new_items) - end])
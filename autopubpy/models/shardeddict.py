@@ -0,0 +1,166 @@
+"""This module contains the sharded dictionary implimentation
+of Publisher.
+
+"""
+import collections
+import json
+import zlib
+from twisted.internet.defer import gatherResults
+from autopubpy.pubsub import attach_clients
+from autopubpy.models.syncdict import SyncDict
+
+
+def shard_index(key, shard_count):
+    """Returns the shard a key belongs to.
+
+    The key is hashed with crc32 of its JSON form instead of hash(),
+    so every session, whatever its interpreter, agrees on the shard
+    and keys survive the trip through the router unchanged.
+
+    Args:
+        key: A key that can be encoded as JSON.
+        shard_count (int): The number of shards.
+
+    """
+    data = json.dumps(key, ensure_ascii=False)
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return (zlib.crc32(data) & 0xffffffff) % shard_count
+
+
+class ShardedSyncDict(collections.MutableMapping):
+    """Dictionary partitioned by key hash across several SyncDicts.
+
+    Each shard is a SyncDict published under <uri>.shard<n> with its own
+    procedures, so a write is published on one shard topic only and
+    each shard snapshot is encoded, cached and fetched on its own.
+
+    attributes:
+        data (iterable): The data that populates the dict.
+        dict_factory(MutableMapping): The type of dict each shard is populated with.
+        shard_count (int): The number of shards, every session sharing
+            the object must use the same count.
+        shard_class (type): The SyncDict class of the shards.
+
+    """
+    shard_count = 8
+    shard_class = SyncDict
+
+    def __init__(self, data=None, shard_count=None, dict_factory=None,
+                 base_uri=u'com', name=u"", codec=None):
+        if shard_count is not None:
+            self.shard_count = shard_count
+        if self.shard_count < 1:
+            raise ValueError("shard_count must be at least 1.")
+        self.base_uri = base_uri
+        self.name = name
+        prefix = name + u'.' if name else u''
+        self.shards = [self.shard_class(dict_factory=dict_factory, base_uri=base_uri,
+                                        name=prefix + u'shard{}'.format(index), codec=codec)
+                       for index in xrange(self.shard_count)]
+        if data is not None:
+            self.update(data)
+
+    @property
+    def uri(self):
+        """unicode: The uri the shard topics are under."""
+        return u'.'.join(part for part in (self.base_uri, self.name) if part)
+
+    def shard_for(self, key):
+        """Returns the shard that holds key."""
+        return self.shards[shard_index(key, self.shard_count)]
+
+    def __getitem__(self, key):
+        return self.shard_for(key)[key]
+
+    def __setitem__(self, key, value):
+        self.shard_for(key)[key] = value
+
+    def __delitem__(self, key):
+        del self.shard_for(key)[key]
+
+    def __iter__(self):
+        for shard in self.shards:
+            for key in shard:
+                yield key
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def __contains__(self, key):
+        return key in self.shard_for(key)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def update(self, other=(), **kwargs):
+        """Updates the dict like dict.update, publishing one event on
+        each shard the items belong to.
+
+        """
+        if isinstance(other, collections.Mapping):
+            items = list(other.items())
+        elif hasattr(other, 'keys'):
+            items = [(key, other[key]) for key in other.keys()]
+        else:
+            items = list(other)
+        items.extend(kwargs.items())
+        by_shard = collections.defaultdict(list)
+        for key, value in items:
+            by_shard[shard_index(key, self.shard_count)].append((key, value))
+        for index in sorted(by_shard):
+            self.shards[index].update(by_shard[index])
+
+    def clear(self):
+        """Removes every item, publishing one event on each non empty shard."""
+        for shard in self.shards:
+            if len(shard):
+                shard.clear()
+
+    def snapshot(self, codec=None):
+        """Returns the snapshot payload of every shard.
+
+        Only the shards that changed since their last snapshot are
+        encoded again.
+
+        Args:
+            codec (unicode): The name of the codec to use, defaults to
+                the codec of the shards.
+
+        Returns:
+            list: The payload of each shard, in shard order.
+
+        """
+        return [shard.snapshot(codec) for shard in self.shards]
+
+    def set_main_session(self, session):
+        """Sets the main session of every shard.
+
+        Args:
+            session (ApplicationSession): The twisted session connected
+                to the router.
+
+        Returns:
+            Deferred(ShardedSyncDict): The dict once every shard is connected.
+
+        """
+        deferred = gatherResults([shard.set_main_session(session) for shard in self.shards],
+                                 consumeErrors=True)
+        deferred.addCallback(lambda _: self)
+        return deferred
+
+    def set_client_session(self, session):
+        """Sets a client session of every shard, the shards are
+        fetched together with attach_clients.
+
+        Args:
+            session (ApplicationSession): The twisted session connected
+                to the router.
+
+        Returns:
+            Deferred(ShardedSyncDict): The dict once every shard is synced.
+
+        """
+        deferred = attach_clients(session, self.shards)
+        deferred.addCallback(lambda _: self)
+        return deferred
@@ -0,0 +1,214 @@
+"""This module contains the array implimentation of
+Publisher.
+
+"""
+import array
+import base64
+import collections
+import sys
+from autopubpy.pubsub import Publisher, method_publish, register_plain_method
+
+
+def _to_bytes(values):
+    """Returns the little endian bytes of an array."""
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+def _from_bytes(typecode, data):
+    """Returns an array of the little endian bytes data."""
+    values = array.array(typecode)
+    values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _write_plain_range(parent, key, start, stop, data, typecode='d'):
+    """Applies _write_range to a nested array a replica holds as a
+    plain list of numbers.
+
+    """
+    parent[key][start:stop] = _from_bytes(str(typecode), base64.b64decode(data)).tolist()
+
+
+register_plain_method('_write_range', _write_plain_range)
+
+
+class SyncArray(Publisher, collections.MutableSequence):
+    """array.array implementation of Publisher.
+
+    The values are kept in one contiguous buffer instead of a list of
+    Python objects. Every change is published as a range of the buffer,
+    [start, stop), and the raw bytes that replace it, so replicas write
+    the update straight into their own buffer. Bytes are little endian
+    and base64 encoded in events so they survive any WAMP serializer.
+    Events carry the typecode too, so replicas that hold a nested array
+    as a plain list of numbers can decode them.
+
+    attributes:
+        data (iterable): The numbers that populate the array.
+        typecode (str): The array.array typecode of the values, 'd' for
+            double precision floats by default.
+
+    """
+    typecode = 'd'
+
+    def __init__(self, data=None, typecode=None, *args, **kwargs):
+        if typecode is not None:
+            self.typecode = str(typecode)
+        self._container = array.array(self.typecode, data or [])
+        super(SyncArray, self).__init__(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._container.__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self._container))
+            if step != 1:
+                raise ValueError("SyncArray only supports contiguous slices.")
+            stop = max(start, stop)
+            values = array.array(self.typecode, value)
+        else:
+            start = self._normalize_index(key)
+            stop = start + 1
+            values = array.array(self.typecode, [value])
+        self.write_range(start, stop, values)
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self._container))
+            if step != 1:
+                raise ValueError("SyncArray only supports contiguous slices.")
+            stop = max(start, stop)
+        else:
+            start = self._normalize_index(key)
+            stop = start + 1
+        self.write_range(start, stop, [])
+
+    def __len__(self):
+        return len(self._container)
+
+    def __repr__(self):
+        return repr(self._container)
+
+    def _normalize_index(self, index):
+        if index < 0:
+            index += len(self._container)
+        if not 0 <= index < len(self._container):
+            raise IndexError("SyncArray index out of range.")
+        return index
+
+    def insert(self, index, value):
+        index = min(max(index + len(self._container) if index < 0 else index, 0),
+                    len(self._container))
+        self.write_range(index, index, [value])
+
+    def extend(self, values):
+        end = len(self._container)
+        self.write_range(end, end, values)
+
+    def reverse(self):
+        values = array.array(self.typecode, self._container)
+        values.reverse()
+        self.write_range(0, len(values), values)
+
+    def write_range(self, start, stop, values):
+        """Replaces the values in [start, stop) and publishes the
+        range with the raw bytes of values.
+
+        Args:
+            start (int): The first index to replace.
+            stop (int): The index after the last value to replace.
+            values (iterable): The new values, the length of the array
+                changes if there are not stop - start values.
+
+        """
+        if not isinstance(values, array.array) or values.typecode != self.typecode:
+            values = array.array(self.typecode, values)
+        self._write_range(start, stop, base64.b64encode(_to_bytes(values)).decode('ascii'),
+                          unicode(self.typecode))
+
+    @method_publish()
+    def _write_range(self, start, stop, data, typecode=None):
+        if typecode is not None:
+            self._set_typecode(typecode)
+        self._container[start:stop] = _from_bytes(self.typecode, base64.b64decode(data))
+
+    def _set_typecode(self, typecode):
+        """Switches to the typecode of the main session, converting the
+        values held so far.
+
+        """
+        typecode = str(typecode)
+        if typecode == self.typecode:
+            return
+        values = self._container.tolist()
+        if typecode not in 'fd':
+            values = [int(value) for value in values]
+        self.typecode = typecode
+        self._container = array.array(typecode, values)
+
+    @property
+    def itemsize(self):
+        """int: The size in bytes of one value."""
+        return self._container.itemsize
+
+    @property
+    def nbytes(self):
+        """int: The size in bytes of the buffer."""
+        return self._container.itemsize * len(self._container)
+
+    def buffer_info(self):
+        """Returns the (address, length) of the buffer, see array.buffer_info."""
+        return self._container.buffer_info()
+
+    def dump_state(self, codec=None):
+        """Returns the buffer and its metadata encoded with the codec.
+
+        Binary codecs get the raw bytes of the buffer, other codecs
+        get them base64 encoded.
+
+        """
+        return self._get_codec(codec).encode(self._snapshot_container(codec))
+
+    def load_state(self, payload, codec=None):
+        self._install_state(self._get_codec(codec).decode(payload))
+
+    def _snapshot_container(self, codec):
+        data = _to_bytes(self._container)
+        if not self._get_codec(codec).binary:
+            data = base64.b64encode(data).decode('ascii')
+        return {u'typecode': unicode(self.typecode),
+                u'byteorder': u'little',
+                u'shape': [len(self._container)],
+                u'data': data}
+
+    def _install_state(self, state):
+        data = state[u'data']
+        if isinstance(data, unicode):
+            data = base64.b64decode(data)
+        self.typecode = str(state[u'typecode'])
+        self._container = _from_bytes(self.typecode, data)
+        self._mark_dirty()
+
+    def _state_items(self):
+        return array.array(self.typecode, self._container)
+
+    def _state_cursor(self):
+        return iter(self._container), len(self._container), False
+
+    def _state_header(self):
+        return {u'typecode': unicode(self.typecode)}
+
+    def _load_header(self, header):
+        self._set_typecode(header[u'typecode'])
+
+    def _load_chunk(self, items, first):
+        if first:
+            self._container = array.array(self.typecode)
+        self._container.extend(array.array(self.typecode, items))
+        self._mark_dirty()
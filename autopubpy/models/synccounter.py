@@ -0,0 +1,94 @@
+"""This module contains the counter implimentation of
+Publisher.
+
+"""
+import numbers
+from autopubpy.pubsub import Publisher, method_publish, register_plain_method
+
+
+def _increment_plain(parent, key, amount=1):
+    """Applies increment to a nested counter a replica holds as a
+    plain number.
+
+    """
+    parent[key] += amount
+
+
+register_plain_method('increment', _increment_plain)
+
+
+class SyncCounter(Publisher):
+    """Counter implementation of Publisher.
+
+    Changes are published as increments instead of values, and
+    increments commute, so any number of sessions can change the
+    counter at once without reading it first and every replica ends up
+    with the same value.
+
+    attributes:
+        value (number): The starting value of the counter.
+
+    """
+
+    def __init__(self, value=0, *args, **kwargs):
+        if not isinstance(value, numbers.Number):
+            raise TypeError("value must be a number not {}.".format(type(value)))
+        self._container = value
+        super(SyncCounter, self).__init__(*args, **kwargs)
+
+    @property
+    def value(self):
+        """number: The current value of the counter."""
+        return self._container
+
+    @method_publish()
+    def increment(self, amount=1):
+        """Adds amount to the counter and publishes the increment."""
+        if not isinstance(amount, numbers.Number):
+            raise TypeError("amount must be a number not {}.".format(type(amount)))
+        self._container += amount
+
+    def decrement(self, amount=1):
+        """Subtracts amount from the counter."""
+        self.increment(-amount)
+
+    def __iadd__(self, amount):
+        self.increment(amount)
+        return self
+
+    def __isub__(self, amount):
+        self.decrement(amount)
+        return self
+
+    def __int__(self):
+        return int(self._container)
+
+    def __float__(self):
+        return float(self._container)
+
+    def __eq__(self, other):
+        if isinstance(other, SyncCounter):
+            other = other.value
+        return self._container == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "SyncCounter({!r})".format(self._container)
+
+    def dump_state(self, codec=None):
+        """Returns the value encoded with the codec."""
+        return self._get_codec(codec).encode(self._container)
+
+    def load_state(self, payload, codec=None):
+        self._install_state(self._get_codec(codec).decode(payload))
+
+    def _snapshot_container(self, codec):
+        return self._container
+
+    def _install_state(self, state):
+        self._container = state
+        self._mark_dirty()
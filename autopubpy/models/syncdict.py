@@ -2,28 +2,63 @@
 Publisher.
 
 """
+import binascii
 import collections
-import json
-from autopubpy.models.basemodel import json_encoder
+from autobahn.wamp.types import SubscribeOptions
 from autopubpy.pubsub import Publisher, method_publish
 
 
+def _key_matcher(key_filter):
+    """Returns a function that tells if a key matches a filter
+    returned by SyncDict._sync_filter.
+
+    """
+    if u'prefix' in key_filter:
+        prefix = key_filter[u'prefix']
+        return lambda key: isinstance(key, basestring) and key.startswith(prefix)
+    return frozenset(key_filter[u'keys']).__contains__
+
+
 class SyncDict(Publisher, collections.MutableMapping):
     """Dictionary implementation of Publisher.
 
     This class can be used just like a dict and publishes changes 
     via the method_publish decorator
 
+    If key_topics is True the changes of a single key are published on
+    <uri>.keys.k<key> instead of the uri, with the key hex encoded so
+    any key makes a valid URI component. A replica created with a
+    key_filter only subscribes to the keys it replicates and fetches
+    only their state. The main session and every replica must agree on
+    key_topics. Bulk operations such as update and clear are still
+    published on the uri, partial replicas drop the items they do not
+    replicate.
+
     attributes:
         data (iterable): The data that populates the dict.
         dict_factory(MutableSequence): The type of dict that is populated.    
+        key_filter (unicode or iterable): Makes this replica partial, a
+            unicode prefix of the keys to replicate or the keys themselves.
+            Setting it enables key_topics.
+        key_topics (bool): If True single key changes are published
+            on per key topics.
         
     """
     dict_factory = dict
+    key_topics = False
+    _key_ops = frozenset(['__setitem__', '__delitem__', 'pop'])
 
     def __init__(self, data=None, dict_factory=None, *args, **kwargs):
         if dict_factory is not None:
             self.dict_factory = dict_factory
+        key_filter = kwargs.pop('key_filter', None)
+        if key_filter is not None and not isinstance(key_filter, basestring):
+            key_filter = frozenset(key_filter)
+        self.key_filter = key_filter
+        self._key_matches = None
+        if key_filter is not None:
+            self.key_topics = True
+            self._key_matches = _key_matcher(self._sync_filter())
         if data is None:
             self._container = self.dict_factory()
         else:
@@ -33,10 +68,10 @@ class SyncDict(Publisher, collections.MutableMapping):
     def __getitem__(self, key):
         return self._container.__getitem__(key)
 
-    @method_publish()
+    @method_publish(conflate=True)
     def __setitem__(self, key, value):
+        self._adopt(value, key)
         return self._container.__setitem__(key, value)
-        self.__setitem__(name, value)
 
     @method_publish()
     def __delitem__(self, key):
@@ -45,6 +80,35 @@ class SyncDict(Publisher, collections.MutableMapping):
     def __delattr__(self, name):
         self.__delattr__(name)
 
+    def update(self, other=(), **kwargs):
+        """Updates the dict like dict.update, the items are
+        published as one event.
+
+        """
+        if isinstance(other, collections.Mapping):
+            items = list(other.items())
+        elif hasattr(other, 'keys'):
+            items = [(key, other[key]) for key in other.keys()]
+        else:
+            items = list(other)
+        items.extend(kwargs.items())
+        self._update(items)
+
+    @method_publish()
+    def _update(self, items):
+        for key, value in items:
+            self._adopt(value, key)
+        self._container.update(items)
+
+    @method_publish()
+    def pop(self, key, *default):
+        return self._container.pop(key, *default)
+
+    @method_publish()
+    def clear(self):
+        """Removes every item and publishes one event."""
+        self._container.clear()
+
     def __iter__(self):
         return self._container.__iter__()
 
@@ -54,15 +118,96 @@ class SyncDict(Publisher, collections.MutableMapping):
     def __repr__(self):
         return self._container.__repr__()
 
-    def as_json(self):
-        payload = json_encoder.encode(self._container)
-        return payload
-
-    def set_json(self, json_string):
-        container = json.loads(json_string)
-        if not isinstance(container, self.dict_factory):
-            container = self.dict_factory(container)
-        self._container = container
+    def dump_state(self, codec=None):
+        return self._get_codec(codec).encode(self._container)
+
+    def load_state(self, payload, codec=None):
+        self._install_state(self._get_codec(codec).decode(
+            payload, object_pairs_hook=self._object_pairs_hook))
+
+    def _snapshot_container(self, codec):
+        freeze = getattr(self._container, 'freeze', None)
+        return self.dict_factory(self._container) if freeze is None else freeze()
+
+    def _install_state(self, state):
+        if not isinstance(state, self.dict_factory):
+            state = self.dict_factory(state)
+        self._container = state
+        self._mark_dirty()
+
+    def _key_topic(self, key):
+        """Returns the topic of the changes of key. The UTF-8 bytes of
+        the key are hex encoded, so the topics of the keys starting with
+        a prefix start with the topic of the prefix.
+
+        """
+        encoded = binascii.hexlify(u'{}'.format(key).encode('utf-8')).decode('ascii')
+        return u'{}.keys.k{}'.format(self.uri, encoded)
+
+    def _event_topic(self, topic, op, args):
+        if self.key_topics and topic == self.uri and self._op_names[op] in self._key_ops:
+            return self._key_topic(args[0])
+        return topic
+
+    def _subscriptions(self):
+        if not self.key_topics:
+            return [(self.uri, None)]
+        if self.key_filter is None:
+            return [(self.uri, None), (self._key_topic(u''), SubscribeOptions(match=u'prefix'))]
+        if isinstance(self.key_filter, basestring):
+            return [(self.uri, None),
+                    (self._key_topic(self.key_filter), SubscribeOptions(match=u'prefix'))]
+        return [(self.uri, None)] + [(self._key_topic(key), None) for key in sorted(self.key_filter)]
+
+    def _sync_filter(self):
+        if self.key_filter is None:
+            return None
+        if isinstance(self.key_filter, basestring):
+            return {u'prefix': self.key_filter}
+        return {u'keys': sorted(self.key_filter)}
+
+    def _filtered_state(self, key_filter, codec=None):
+        matches = _key_matcher(key_filter)
+        return self._get_codec(codec).encode(self.dict_factory(
+            (key, value) for key, value in self._container.items() if matches(key)))
+
+    def _call_op(self, op, args):
+        """Drops the parts of an event a partial replica does not replicate."""
+        if self._key_matches is None or self._authoritative:
+            return super(SyncDict, self)._call_op(op, args)
+        matches = self._key_matches
+        name = self._op_names[op]
+        if name in self._key_ops or name == 'apply_path':
+            if not matches(args[0][0] if name == 'apply_path' else args[0]):
+                return None
+        elif name == '_update':
+            args = [[item for item in args[0] if matches(item[0])]]
+        return_value = super(SyncDict, self)._call_op(op, args)
+        if name == 'load_state':
+            for key in [key for key in self._container if not matches(key)]:
+                del self._container[key]
+        return return_value
+
+    def _child_key(self, child):
+        key = child._parent_key
+        if key in self._container and self._container[key] is child:
+            return key
+        return None
+
+    def _state_items(self):
+        return list(self._container.items())
+
+    def _state_cursor(self):
+        freeze = getattr(self._container, 'freeze', None)
+        items = self._container if freeze is None else freeze()
+        return items.iteritems(), len(items), freeze is not None
+
+    def _load_chunk(self, items, first):
+        if first:
+            self._container = self.dict_factory(items)
+        else:
+            self._container.update(items)
+        self._mark_dirty()
 
     @classmethod
     def from_JSON(cls, json_string):
@@ -76,12 +221,7 @@ class SyncOrderedDict(SyncDict):
 
     """
     dict_factory = collections.OrderedDict
-
-    def set_json(self, json_string):
-        container = json.loads(json_string, object_pairs_hook=collections.OrderedDict)
-        if not isinstance(container, self.dict_factory):
-            container = self.dict_factory(container)
-        self._container = container
+    _object_pairs_hook = collections.OrderedDict
 
 """
 class _SyncDictNameSpace(Publisher, collections.MutableMapping):
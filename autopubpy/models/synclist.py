@@ -3,23 +3,122 @@ Publisher.
 
 """
 import collections
-import json
-from autopubpy.models.basemodel import json_encoder
+import sys
 from autopubpy.pubsub import Publisher, method_publish
 
 
+class _ValueIndex(object):
+    """Counts the hashable values of a list and caches the first
+    position of each of them.
+
+    The counts are kept up to date by every change. The positions are
+    rebuilt by the first lookup after a change that moves values, and
+    kept up to date by appends and by assignments that do not.
+
+    """
+
+    def __init__(self, values=()):
+        self.counts = {}
+        self.positions = None
+        self.add(values)
+
+    def add(self, values, start=None):
+        """Counts values, start is their position if they were appended."""
+        counts = self.counts
+        positions = self.positions if start is not None else None
+        if start is None:
+            self.positions = None
+        for offset, value in enumerate(values):
+            try:
+                counts[value] = counts.get(value, 0) + 1
+            except TypeError:
+                continue
+            if positions is not None:
+                positions.setdefault(value, start + offset)
+
+    def discard(self, values):
+        """Stops counting values, which were removed from the list."""
+        counts = self.counts
+        self.positions = None
+        for value in values:
+            try:
+                count = counts[value]
+            except (KeyError, TypeError):
+                continue
+            if count == 1:
+                del counts[value]
+            else:
+                counts[value] = count - 1
+
+    def replace(self, position, old, new):
+        """Counts the assignment of new over old at position."""
+        positions = self.positions
+        self.discard([old])
+        self.add([new])
+        if positions is None:
+            return
+        try:
+            first = positions.get(old)
+        except TypeError:
+            first = None
+        if first == position:
+            if old in self.counts:
+                return
+            del positions[old]
+        try:
+            if positions.get(new, position) >= position:
+                positions[new] = position
+        except TypeError:
+            pass
+        self.positions = positions
+
+    def first(self, values, value):
+        """Returns the first position of value in values.
+
+        Raises:
+            KeyError: If value is not in values.
+            TypeError: If value is not hashable.
+
+        """
+        if value not in self.counts:
+            raise KeyError(value)
+        if self.positions is None:
+            positions = {}
+            for position, item in enumerate(values):
+                try:
+                    positions.setdefault(item, position)
+                except TypeError:
+                    pass
+            self.positions = positions
+        return self.positions[value]
+
+    def nbytes(self):
+        """Returns the size in bytes of the index, not of the values."""
+        size = sys.getsizeof(self.counts)
+        if self.positions is not None:
+            size += sys.getsizeof(self.positions)
+        return size
+
+
 class SyncList(Publisher, collections.MutableSequence):
     """MutableSequence implementation of Publisher.
 
     This class can be used just like a list and publishes changes 
     via the method_publish decorator
 
+    If indexed is True the list keeps an index of its hashable values,
+    so in, count, index and remove look the value up instead of scanning
+    the list, as long as the list does not change between lookups.
+    Unhashable values are still found by scanning.
+
     attributes:
         data (iterable): The data that populates the list.
         list_factory(MutableSequence): The type of list that is populated.
+        indexed (bool): If True lookups by value use an index.
 
     """
     list_factory = list
+    indexed = False
 
     def __init__(self, data=None, list_factory=None, *args, **kwargs):
         if list_factory is not None:
@@ -28,17 +127,36 @@ class SyncList(Publisher, collections.MutableSequence):
             self._container = self.list_factory()
         else:
             self._container = self.list_factory(data)
+        self._index = _ValueIndex(self._container) if self.indexed else None
         super(SyncList, self).__init__(*args, **kwargs)
         
     def __getitem__(self, key):
         return self._container.__getitem__(key)
 
-    @method_publish()
+    @method_publish(conflate=True)
     def __setitem__(self, key, value):
-        return self._container.__setitem__(key, value)
+        if isinstance(key, slice):
+            value = list(value)
+            start, _, step = key.indices(len(self._container))
+            for offset, item in enumerate(value):
+                self._adopt(item, start + offset * step)
+        else:
+            self._adopt(value, key + len(self._container) if key < 0 else key)
+        if self._index is None:
+            return self._container.__setitem__(key, value)
+        old = self._container[key]
+        self._container.__setitem__(key, value)
+        if isinstance(key, slice):
+            self._index.discard(old)
+            self._index.add(value)
+        else:
+            self._index.replace(key % len(self._container), old, value)
 
     @method_publish()
     def __delitem__(self, key):
+        if self._index is not None:
+            old = self._container[key]
+            self._index.discard(old if isinstance(key, slice) else [old])
         return self._container.__delitem__(key)
         
     def __len__(self):
@@ -52,20 +170,158 @@ class SyncList(Publisher, collections.MutableSequence):
     
     @method_publish()
     def insert(self, index, value):
+        size = len(self._container)
+        self._adopt(value, min(max(index + size if index < 0 else index, 0), size))
         return_value = self._container.insert(index, value)
+        if self._index is not None:
+            self._index.add([value], size if index >= size else None)
         return return_value
     
     @method_publish()
     def sort(self, *args, **kwargs):
         self._container.sort(*args, **kwargs)
+        if self._index is not None:
+            self._index.positions = None
+
+    def __contains__(self, value):
+        if self._index is not None:
+            try:
+                return value in self._index.counts
+            except TypeError:
+                pass
+        return super(SyncList, self).__contains__(value)
+
+    def count(self, value):
+        if self._index is not None:
+            try:
+                return self._index.counts.get(value, 0)
+            except TypeError:
+                pass
+        return super(SyncList, self).count(value)
+
+    def index(self, value):
+        if self._index is not None:
+            try:
+                return self._index.first(self._container, value)
+            except KeyError:
+                raise ValueError("{!r} is not in list".format(value))
+            except TypeError:
+                pass
+        return super(SyncList, self).index(value)
+
+    @property
+    def index_stats(self):
+        """dict: The number of distinct indexed 'values', whether their
+        'positions' are cached and the 'bytes' the index uses, or None
+        if the list is not indexed.
+
+        """
+        if self._index is None:
+            return None
+        return {u'values': len(self._index.counts),
+                u'positions': self._index.positions is not None,
+                u'bytes': self._index.nbytes()}
+
+    def extend(self, values):
+        """Appends every value and publishes them as one event."""
+        self._extend(list(values))
+
+    @method_publish()
+    def _extend(self, values):
+        size = len(self._container)
+        for offset, value in enumerate(values):
+            self._adopt(value, size + offset)
+        self._container.extend(values)
+        if self._index is not None:
+            self._index.add(values, size)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    @method_publish()
+    def pop(self, index=-1):
+        value = self._container.pop(index)
+        if self._index is not None:
+            self._index.discard([value])
+        return value
+
+    @method_publish()
+    def remove(self, value):
+        if self._index is None:
+            self._container.remove(value)
+        else:
+            del self._container[self.index(value)]
+            self._index.discard([value])
+
+    @method_publish()
+    def clear(self):
+        """Removes every value and publishes one event."""
+        del self._container[:]
+        if self._index is not None:
+            self._index = _ValueIndex()
+
+    @method_publish()
+    def reverse(self):
+        self._container.reverse()
+        if self._index is not None:
+            self._index.positions = None
         
-    def as_json(self):
-        """Returns the entire json string of the container."""
-        payload = json_encoder.encode(self._container)
-        return payload
-
-    def set_json(self, json_string):
-        container = json.loads(json_string)
-        if not isinstance(container, self.list_factory):
-            container = self.list_factory(container)
-        self._container = container
+    def dump_state(self, codec=None):
+        """Returns the entire container encoded with the codec."""
+        return self._get_codec(codec).encode(self._container)
+
+    def load_state(self, payload, codec=None):
+        self._install_state(self._get_codec(codec).decode(payload))
+
+    def _snapshot_container(self, codec):
+        freeze = getattr(self._container, 'freeze', None)
+        return list(self._container) if freeze is None else freeze()
+
+    def _install_state(self, state):
+        if not isinstance(state, self.list_factory):
+            state = self.list_factory(state)
+        self._container = state
+        self._reindex()
+        self._mark_dirty()
+
+    def _reindex(self):
+        """Rebuilds the index after the whole container is replaced."""
+        if self._index is not None:
+            self._index = _ValueIndex(self._container)
+
+    def _state_items(self):
+        return list(self._container)
+
+    def _state_cursor(self):
+        freeze = getattr(self._container, 'freeze', None)
+        items = self._container if freeze is None else freeze()
+        return iter(items), len(items), freeze is not None
+
+    def _load_chunk(self, items, first):
+        if first:
+            self._container = self.list_factory(items)
+            self._reindex()
+        else:
+            size = len(self._container)
+            self._container.extend(items)
+            if self._index is not None:
+                self._index.add(items, size)
+        self._mark_dirty()
+
+    def _conflation_key(self, key):
+        if isinstance(key, (int, long)) and key < 0:
+            return key + len(self._container)
+        return key
+
+    def _child_key(self, child):
+        container = self._container
+        index = child._parent_key
+        if (isinstance(index, (int, long)) and 0 <= index < len(container)
+                and container[index] is child):
+            return index
+        for index, value in enumerate(container):
+            if value is child:
+                child._parent_key = index
+                return index
+        return None
@@ -0,0 +1,185 @@
+"""This module contains the set implimentation of
+Publisher.
+
+"""
+import collections
+import itertools
+import uuid
+from autopubpy.pubsub import Publisher, method_publish, register_plain_method
+
+
+def _add_plain_tag(parent, key, value, tag):
+    """Applies _add to a nested set a replica holds as a plain dict of
+    each value to its tags.
+
+    """
+    tags = parent[key].setdefault(value, [])
+    if tag not in tags:
+        tags.append(tag)
+
+
+def _add_plain_tags(parent, key, items):
+    """Applies _add_many to a nested set a replica holds as a plain dict."""
+    for value, tag in items:
+        _add_plain_tag(parent, key, value, tag)
+
+
+def _discard_plain_tags(parent, key, items):
+    """Applies _discard to a nested set a replica holds as a plain dict
+    of each value to its tags.
+
+    """
+    container = parent[key]
+    for value, tags in items:
+        current = container.get(value)
+        if current is None:
+            continue
+        current[:] = [tag for tag in current if tag not in tags]
+        if not current:
+            del container[value]
+
+
+register_plain_method('_add', _add_plain_tag)
+register_plain_method('_add_many', _add_plain_tags)
+register_plain_method('_discard', _discard_plain_tags)
+
+
+class SyncSet(Publisher, collections.MutableSet):
+    """MutableSet implementation of Publisher.
+
+    Every value carries the tags of the adds that put it in the set, a
+    tag is unique to the session that added the value. Adds publish the
+    new tag and discards publish the tags they observed, so a discard
+    only undoes the adds its session had seen. Adds and discards
+    commute, any number of sessions can change the set at once without
+    waiting for each other, whatever order the main session publishes
+    their changes in every replica ends up with the same values. A
+    value added in one session while another discards it stays in the
+    set.
+
+    Values must be hashable once decoded, like strings and numbers. A
+    set nested in another model is encoded as a dict of each value to
+    its tags, so its values must be strings, like the keys of a SyncDict.
+
+    attributes:
+        data (iterable): The values that populate the set.
+
+    """
+
+    def __init__(self, data=None, *args, **kwargs):
+        self._container = {}
+        self._tag_prefix = uuid.uuid4().hex[:16]
+        self._tag_ids = itertools.count()
+        for value in data or ():
+            self._container.setdefault(value, set()).add(self._new_tag())
+        super(SyncSet, self).__init__(*args, **kwargs)
+
+    def _new_tag(self):
+        return u'{}.{}'.format(self._tag_prefix, next(self._tag_ids))
+
+    def __contains__(self, value):
+        return value in self._container
+
+    def __iter__(self):
+        return iter(self._container)
+
+    def __len__(self):
+        return len(self._container)
+
+    def __repr__(self):
+        return "SyncSet({!r})".format(list(self._container))
+
+    @classmethod
+    def _from_iterable(cls, values):
+        return set(values)
+
+    def add(self, value):
+        """Adds value to the set with a new tag."""
+        hash(value)
+        self._add(value, self._new_tag())
+
+    @method_publish()
+    def _add(self, value, tag):
+        self._container.setdefault(value, set()).add(tag)
+
+    def discard(self, value):
+        """Removes value from the set if it is in it."""
+        tags = self._container.get(value)
+        if tags is not None:
+            self._discard([[value, list(tags)]])
+
+    def update(self, *iterables):
+        """Adds every value and publishes them as one event."""
+        items = [[value, self._new_tag()] for value in itertools.chain(*iterables)]
+        if items:
+            self._add_many(items)
+
+    @method_publish()
+    def _add_many(self, items):
+        container = self._container
+        for value, tag in items:
+            container.setdefault(value, set()).add(tag)
+
+    def difference_update(self, *iterables):
+        """Removes every value and publishes them as one event."""
+        container = self._container
+        items = [[value, list(container[value])]
+                 for value in set(itertools.chain(*iterables)) if value in container]
+        if items:
+            self._discard(items)
+
+    def clear(self):
+        """Removes every value and publishes one event."""
+        if self._container:
+            self._discard([[value, list(tags)] for value, tags in self._container.iteritems()])
+
+    @method_publish()
+    def _discard(self, items):
+        container = self._container
+        for value, tags in items:
+            current = container.get(value)
+            if current is None:
+                continue
+            current.difference_update(tags)
+            if not current:
+                del container[value]
+
+    def __ior__(self, values):
+        self.update(values)
+        return self
+
+    def __isub__(self, values):
+        if values is self:
+            self.clear()
+        else:
+            self.difference_update(values)
+        return self
+
+    def dump_state(self, codec=None):
+        """Returns every value and its tags encoded with the codec."""
+        return self._get_codec(codec).encode(self._snapshot_container(codec))
+
+    def load_state(self, payload, codec=None):
+        self._install_state(self._get_codec(codec).decode(payload))
+
+    def _snapshot_container(self, codec):
+        return self._state_items()
+
+    def _install_state(self, state):
+        self._container = {}
+        self._load_chunk(state, False)
+
+    def _state_items(self):
+        return [[value, sorted(tags)] for value, tags in self._container.iteritems()]
+
+    def _state_cursor(self):
+        items = ([value, sorted(tags)] for value, tags in self._container.iteritems())
+        return items, len(self._container), False
+
+    def _load_chunk(self, items, first):
+        if first:
+            self._container = {}
+        container = self._container
+        for value, tags in items:
+            container.setdefault(value, set()).update(tags)
+        self._mark_dirty()
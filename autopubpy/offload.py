@@ -0,0 +1,123 @@
+"""This module contains the pools Publisher encodes and decodes
+state in, away from the reactor thread.
+
+Set the snapshot_pool attribute of a Publisher (or a Publisher subclass)
+to one of these pools. The main session then encodes the state clients
+fetch in the pool, from a shallow copy of the container taken on the
+reactor thread, so the object keeps changing while the copy is encoded.
+Clients decode the fetched state in their pool before installing it.
+
+Example:
+    SyncDict.snapshot_pool = ThreadPool()
+
+"""
+import multiprocessing
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThread
+from autopubpy.serialization import get_codec
+
+
+def encode_payload(codec_name, obj):
+    """Returns obj encoded with the codec named codec_name."""
+    return get_codec(codec_name).encode(obj)
+
+
+def decode_payload(codec_name, payload, object_pairs_hook=None):
+    """Returns the object a payload encoded with the codec named
+    codec_name holds.
+
+    """
+    return get_codec(codec_name).decode(payload, object_pairs_hook=object_pairs_hook)
+
+
+class InlinePool(object):
+    """Runs functions right away on the calling thread."""
+
+    def run(self, func, *args):
+        """Runs func(*args).
+
+        Returns:
+            Deferred: The result of func.
+
+        """
+        return maybeDeferred(func, *args)
+
+
+class ThreadPool(object):
+    """Runs functions in the thread pool of the reactor.
+
+    Encoding releases the GIL only in parts, so this keeps the reactor
+    responsive rather than using more cores.
+
+    """
+
+    def run(self, func, *args):
+        """Runs func(*args) in a thread.
+
+        Returns:
+            Deferred: The result of func, fired on the reactor thread.
+
+        """
+        return deferToThread(func, *args)
+
+
+def _call(func, args):
+    """Runs func in a worker process, the exception is returned
+    since Python 2 pools have no error callback.
+
+    """
+    try:
+        return True, func(*args)
+    except Exception as e:  #pylint: disable=broad-except
+        return False, e
+
+
+class ProcessPool(object):
+    """Runs functions in a multiprocessing pool, so encoding uses
+    other cores.
+
+    The function and its arguments are pickled to the worker, so the
+    function must be defined at module level, like encode_payload.
+
+    Args:
+        processes (int): The number of worker processes, the number
+            of cores by default.
+        reactor (IReactorThreads): The reactor the results are fired on.
+
+    """
+
+    def __init__(self, processes=None, reactor=None):
+        self._pool = multiprocessing.Pool(processes)
+        self._reactor = reactor
+
+    @property
+    def reactor(self):
+        """IReactorThreads: The reactor the results are fired on."""
+        if self._reactor is None:
+            from twisted.internet import reactor
+            self._reactor = reactor
+        return self._reactor
+
+    def run(self, func, *args):
+        """Runs func(*args) in a worker process.
+
+        Returns:
+            Deferred: The result of func, fired on the reactor thread.
+
+        """
+        deferred = Deferred()
+
+        def done(outcome):
+            succeeded, result = outcome
+            if succeeded:
+                self.reactor.callFromThread(deferred.callback, result)
+            else:
+                self.reactor.callFromThread(deferred.errback, result)
+
+        self._pool.apply_async(_call, (func, args), callback=done)
+        return deferred
+
+    def close(self):
+        """Waits for the queued functions and stops the workers."""
+        self._pool.close()
+        self._pool.join()
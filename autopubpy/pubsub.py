@@ -6,13 +6,49 @@ this module.
 
 """
 import abc
+import collections
 import contextlib
 import functools
+import itertools
+import timeit
 import types
+import uuid
 import weakref
 from autobahn.wamp.exception import TransportLost
 from autobahn.wamp.types import PublishOptions
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import (Deferred, gatherResults, inlineCallbacks, maybeDeferred,
+                                    returnValue, succeed)
+from twisted.python.failure import Failure
+from autopubpy.compression import CompressionStats, choose_compressor, pack, unpack
+from autopubpy.instrumentation import null_instrumentation
+from autopubpy.offload import decode_payload, encode_payload
+from autopubpy.serialization import get_codec
+
+
+class PublisherMeta(abc.ABCMeta):
+    """Metaclass of Publisher that builds the dispatch table of a class.
+
+    The methods decorated with method_publish, along with the names in
+    _sync_methods, are the only methods replicas may call. Each of them
+    is given a small integer op code, sorted by name so every session
+    running the same class agrees on the codes. Events are published
+    with the op code and dispatched through _op_table.
+
+    """
+    def __init__(cls, name, bases, namespace):
+        super(PublisherMeta, cls).__init__(name, bases, namespace)
+        functions = {}
+        for klass in reversed(cls.__mro__):
+            for attr_name, value in vars(klass).iteritems():
+                if getattr(value, '_method_publish', False):
+                    functions[attr_name] = value
+                elif attr_name in functions:
+                    del functions[attr_name]
+        for attr_name in getattr(cls, '_sync_methods', ()):
+            functions[attr_name] = getattr(cls, attr_name).__func__
+        cls._op_names = tuple(sorted(functions))
+        cls._op_codes = dict((attr_name, op) for op, attr_name in enumerate(cls._op_names))
+        cls._op_table = tuple(functions[attr_name] for attr_name in cls._op_names)
 
 
 class Publisher(object):
@@ -22,50 +58,418 @@ class Publisher(object):
     various sessions. Impliment the abstract methods, and use the 
     "method_publish" decorator on methods that set the state of the object.
 
+    A change made on a client is applied right away and published with
+    an origin token. The main session applies it, assigns it a version
+    and publishes it again, the other clients apply that event and the
+    client that made the change only adopts its version.
+
     Attributes:
         
         name (unicode): The name of the object, it will be appened at the end of the URI
             for publishing events.
+        oplog_size (int): The number of published operations the main session
+            keeps so reconnecting clients can catch up without a full snapshot.
+        codec (unicode): The name of the registered codec used to serialize
+            the state of the object, see autopubpy.serialization.
+        chunk_size (int): If set, clients fetch the state in chunks of this
+            many items with fetch_range instead of one snapshot.
+        max_transfers (int): The number of chunked transfers the main session
+            serves at once, the oldest transfer expires first.
+        transfer_restarts (int): The number of times a client restarts a
+            chunked transfer that expired because the object changed, before
+            it fetches the state in one snapshot instead.
+        instrumentation (Instrumentation): Receives the metrics of the object,
+            see autopubpy.instrumentation.
+        conflate_interval (float): If set, methods decorated with
+            method_publish(conflate=True) publish at most once per key every
+            conflate_interval seconds, and only with the latest arguments.
+        clock (IReactorTime): Schedules conflated flushes and publish queue
+            drains, the twisted reactor by default.
+        publish_queue_size (int): If set, events are queued and published by
+            the reactor in the background instead of inside the mutating
+            call, with at most this many events waiting.
+        overflow_policy (unicode): What happens when the publish queue is full.
+            'block' publishes the oldest events right away, 'drop_oldest'
+            discards them, clients fetch them when the next event arrives,
+            and 'resync' replaces the queue with one event carrying the
+            full state.
+        drain_size (int): The number of queued events published per
+            reactor iteration.
+        compression (unicode): If set, the name of the compressor used for
+            state broadcasts and bulk events of at least compression_threshold
+            bytes. The main session only compresses events once every
+            client that synced has it in its accept_encodings, and a
+            client only if the main session has it in its own. The state
+            a client fetches is compressed with a compressor from its
+            accept_encodings whatever this is set to.
+        compression_threshold (int): The size in bytes below which payloads
+            are not compressed.
+        accept_encodings (tuple(unicode)): The compressors a session accepts
+            for the state it fetches and the events it receives, see
+            autopubpy.compression.
+        share_payloads (bool): If True and more than one session is
+            subscribed, the arguments of an event are encoded once with the
+            codec and every session publishes the same payload instead of
+            serializing the arguments again. The payload is then encoded a
+            second time in the WAMP message, which only pays off for large
+            events sent to many sessions, so this is off by default.
+        snapshot_pool (InlinePool): If set, the state clients fetch is encoded
+            by the main session, and decoded by clients, in this pool instead
+            of on the reactor thread, see autopubpy.offload.
         
     """
-    __metaclass__ = abc.ABCMeta
+    __metaclass__ = PublisherMeta
+    _sync_methods = ('apply_batch', 'apply_path', 'load_state')
     base_uri = None
+    oplog_size = 1000
+    codec = u'json'
+    chunk_size = None
+    max_transfers = 16
+    transfer_restarts = 3
+    instrumentation = null_instrumentation
+    conflate_interval = None
+    clock = None
+    publish_queue_size = None
+    overflow_policy = u'block'
+    drain_size = 100
+    compression = None
+    compression_threshold = 16384
+    accept_encodings = (u'zlib',)
+    share_payloads = False
+    snapshot_pool = None
+    _object_pairs_hook = None
+    _full_state_ops = frozenset(['load_state', '_load_chunk'])
+    _compress_ops = frozenset(['apply_batch', 'load_state', '_extend', '_update', '_add_many',
+                               '_write_range', '_discard'])
 
-    def __init__(self, base_uri='com', name=u""):
+    def __init__(self, base_uri='com', name=u"", codec=None):
+        if codec is not None:
+            self.codec = codec
+        get_codec(self.codec)
         self._connected = False
         self._object_name = name
         self._propagate = True
+        self._batch = None
         self._subscribers = weakref.WeakSet()
+        self._version = 0
+        self._authoritative = True
+        self._oplog = collections.deque(maxlen=self.oplog_size)
+        self._origin_prefix = uuid.uuid4().hex[:16]
+        self._origin_ids = itertools.count()
+        self._originated = collections.OrderedDict()
+        self._pending_events = None
+        self._snapshots = {}
+        self._snapshot_hits = 0
+        self._snapshot_misses = 0
+        self._transfers = collections.OrderedDict()
+        self._transfer_ids = itertools.count(1)
+        self._parent = None
+        self._parent_key = None
+        self._has_children = False
+        self._conflated = collections.OrderedDict()
+        self._flush_call = None
+        self._queue = collections.deque()
+        self._drain_call = None
+        self._queue_stats = collections.Counter()
+        self._drain_rate = 0.0
+        self._hub = None
+        self._journal = None
+        self._compression_stats = CompressionStats()
+        self._state_serial = 0
+        self._encodings = {}
+        self._event_encodings = None
         self.set_base_uri(base_uri)
 
     @abc.abstractmethod
-    def as_json(self):
+    def dump_state(self, codec=None):
         """Reimpliment this method to get the state of the object.
         
+        Args:
+            codec (unicode): The name of the codec to use, defaults to
+                the codec of the object.
+
         Example:
-            def as_json(self):
-                payload = json_encoder.encode(self._container)
-                return payload
+            def dump_state(self, codec=None):
+                return self._get_codec(codec).encode(self._container)
 
         Returns:
-            unicode: The json representation of the object
+            unicode or bytes: The encoded state of the object.
+
         """
-        raise NotImplementedError("You must impliment as_json in a subclass.")
+        raise NotImplementedError("You must impliment dump_state in a subclass.")
 
     @abc.abstractmethod
-    def set_json(self, json_string):
+    def load_state(self, payload, codec=None):
         """Reimpliment this method to set the state of the object.
         
         Args:
-            json_string (unicode): The JSON state of the object, the format should
-                match the as_json implimentation.
+            payload (unicode or bytes): The encoded state of the object, the
+                format should match the dump_state implimentation.
+            codec (unicode): The name of the codec the payload was encoded
+                with, defaults to the codec of the object.
 
         Example:
-            def set_json(self, json_string):
-                self._container = json.loads(json_string, object_pairs_hook=collections.OrderedDict)
+            def load_state(self, payload, codec=None):
+                self._container = self._get_codec(codec).decode(payload)
+
+        """
+        raise NotImplementedError("You must impliment load_state in a subclass.")
+
+    def as_json(self):
+        """Returns the state of the object as a JSON string."""
+        return self.snapshot(u'json')
+
+    def set_json(self, json_string):
+        """Sets the state of the object from a JSON string
+        returned by as_json.
+
+        """
+        self.load_state(json_string, u'json')
+
+    def snapshot(self, codec=None):
+        """Returns the dump_state payload of the object, encoding it only
+        if the object changed since the last snapshot with the same codec.
+
+        Every snapshot request between two mutations shares one encode,
+        so many clients joining at once cost a single dump_state.
+
+        Args:
+            codec (unicode): The name of the codec to use, defaults to
+                the codec of the object.
+
+        """
+        name = self.codec if codec is None else codec
+        try:
+            payload = self._snapshots[name]
+        except KeyError:
+            self._snapshot_misses += 1
+            payload = self._snapshots[name] = self.dump_state(name)
+        else:
+            self._snapshot_hits += 1
+        return payload
+
+    @property
+    def snapshot_stats(self):
+        """dict: The snapshot cache 'hits', 'misses' and the codec
+        names of the currently 'cached' payloads.
+
+        """
+        return {u'hits': self._snapshot_hits,
+                u'misses': self._snapshot_misses,
+                u'cached': sorted(self._snapshots)}
+
+    def snapshot_async(self, codec=None):
+        """Returns the snapshot payload of the object, encoded in
+        snapshot_pool if it is set.
+
+        The container is copied right away, so the payload is the state
+        at the time of the call even if the object changes while the copy
+        is encoded. Calls made before the object changes share one encode.
+
+        Args:
+            codec (unicode): The name of the codec to use, defaults to
+                the codec of the object.
+
+        Returns:
+            Deferred: The payload.
+
+        """
+        name = self.codec if codec is None else codec
+        if name in self._snapshots or self.snapshot_pool is None or self._has_children:
+            return succeed(self.snapshot(name))
+        waiter = Deferred()
+        key = (name, self._state_serial)
+        waiters = self._encodings.get(key)
+        if waiters is not None:
+            self._snapshot_hits += 1
+            waiters.append(waiter)
+            return waiter
+        try:
+            container = self._snapshot_container(name)
+        except NotImplementedError:
+            return succeed(self.snapshot(name))
+        self._snapshot_misses += 1
+        self._encodings[key] = [waiter]
+        self.snapshot_pool.run(encode_payload, name, container).addBoth(self._encoded, key)
+        return waiter
+
+    def _encoded(self, result, key):
+        """Caches a payload encoded by snapshot_async, unless the object
+        changed meanwhile, and fires every call waiting for it.
+
+        """
+        waiters = self._encodings.pop(key)
+        name, serial = key
+        if isinstance(result, Failure):
+            for waiter in waiters:
+                waiter.errback(result)
+            return
+        if serial == self._state_serial:
+            self._snapshots[name] = result
+        for waiter in waiters:
+            waiter.callback(result)
+
+    def _snapshot_container(self, codec):
+        """Reimpliment this method to return a shallow copy of the state
+        that encodes to the dump_state payload, used to encode it off the
+        reactor thread.
+
+        Args:
+            codec (unicode): The name of the codec the copy is encoded with.
+
+        """
+        raise NotImplementedError("{} cannot be encoded off the reactor.".format(type(self).__name__))
+
+    def _install_state(self, state):
+        """Reimpliment this method to replace the state with the object
+        decoded from a dump_state payload, used to decode it off the
+        reactor thread.
+
+        """
+        raise NotImplementedError("{} cannot be decoded off the reactor.".format(type(self).__name__))
+
+    def _packed_snapshot(self, encoding):
+        """Returns the snapshot compressed with the compressor named
+        encoding, cached along with the snapshot.
+
+        """
+        payload = self.snapshot()
+        if encoding is None:
+            return payload
+        name = u'{}+{}'.format(self.codec, encoding)
+        try:
+            return self._snapshots[name]
+        except KeyError:
+            packed = self._snapshots[name] = pack(payload, encoding, self.compression_threshold,
+                                                  self._compression_stats)
+            return packed
+
+    @property
+    def compression_stats(self):
+        """dict: The number of 'payloads' compressed, their 'raw_bytes' and
+        'compressed_bytes', the 'ratio' between them and the seconds spent
+        compressing and decompressing, see CompressionStats.
+
+        """
+        return self._compression_stats.as_dict()
+
+    def _mark_dirty(self):
+        """Discards the cached snapshots of the object and of the models
+        it is nested in, call this whenever the state of the object changes.
+
+        """
+        node = self
+        while node is not None:
+            node._state_serial += 1
+            if node._snapshots:
+                node._snapshots.clear()
+            node = node._parent() if node._parent is not None else None
+
+    def _adopt(self, value, key=None):
+        """Nests value in this object if it is a Publisher.
+
+        A nested model does not publish its own events, it publishes the
+        path to itself along with the operation through the root model,
+        see apply_path. Call this whenever a value is stored.
+
+        Args:
+            value: The value being stored in the object.
+            key: The key of the value, only needed by _child_key.
+
+        """
+        if isinstance(value, Publisher):
+            value._parent = weakref.ref(self)
+            value._parent_key = key
+            self._has_children = True
+
+    def _child_key(self, child):
+        """Reimpliment this method to support nested models.
+
+        child._parent_key holds the key the child was last adopted or
+        found under, check it first so finding a child does not scan
+        the whole object.
+
+        Returns:
+            The key of child in this object, or None if child is no
+                longer stored in this object.
+
+        """
+        return None
+
+    def _path(self):
+        """Returns the root model this object is nested in, and the
+        list of keys from the root to this object.
+
+        """
+        path = []
+        node = self
+        while node._parent is not None:
+            parent = node._parent()
+            key = None if parent is None else parent._child_key(node)
+            if key is None:
+                node._parent = None
+                break
+            path.append(key)
+            node = parent
+        path.reverse()
+        return node, path
+
+    def _state_items(self):
+        """Reimpliment this method to support chunked transfers.
+
+        Returns:
+            list: The state of the object as a list of items, a chunk of
+                these items is passed to _load_chunk on the client.
+
+        """
+        raise NotImplementedError("You must impliment _state_items in a subclass.")
+
+    def _state_cursor(self):
+        """Returns an iterator over the items _state_items returns, used
+        by fetch_range to page the state without copying it.
+
+        Reimpliment this method to page the live container, or a frozen
+        version of it, the default iterates a copy from _state_items.
+
+        Returns:
+            tuple: The iterator, the number of items and True if the
+                iterator reads a version of the state that does not
+                change with the object, otherwise transfers expire as
+                soon as the object changes.
+
+        """
+        items = self._state_items()
+        return iter(items), len(items), True
+
+    def _load_chunk(self, items, first):
+        """Reimpliment this method to support chunked transfers.
+
+        Args:
+            items (list): A chunk of the items returned by _state_items.
+            first (bool): True if this is the first chunk, the current
+                state should be replaced instead of extended.
+
+        """
+        raise NotImplementedError("You must impliment _load_chunk in a subclass.")
+
+    def _state_header(self):
+        """Returns what a client needs to know to load the items of a
+        chunked transfer, like their type, sent along with every chunk,
+        or None if the items are enough.
+
+        """
+        return None
+
+    def _load_header(self, header):
+        """Applies the _state_header of the main session before a chunk
+        is passed to _load_chunk.
 
         """
-        raise NotImplementedError("You must impliment set_json in a subclass.")
+        pass
+
+    def _get_codec(self, codec=None):
+        """Returns the codec named codec, or the codec of the object."""
+        return get_codec(self.codec if codec is None else codec)
 
     @property
     def uri(self):
@@ -74,6 +478,16 @@ class Publisher(object):
         """
         return self._uri
 
+    @property
+    def version(self):
+        """int: The version of the last operation applied to this object.
+
+        Versions are assigned by the main session, clients adopt the
+        version carried by each event they receive.
+
+        """
+        return self._version
+
     @property
     def subscribers(self):
         """generator(session): Returns a generator of the
@@ -127,6 +541,60 @@ class Publisher(object):
                            "Object {} is not subscribed.".format(type(subscriber)))
         self._subscribers.remove(subscriber)
 
+    def _subscriptions(self):
+        """Returns the (topic, SubscribeOptions) pairs the events of the
+        object are published on, options may be None.
+
+        """
+        return [(self.uri, None)]
+
+    def _subscribe_events(self, session):
+        """Subscribes _receive_sync_event to every topic of _subscriptions.
+
+        Returns:
+            Deferred: Fires once every subscription is made.
+
+        """
+        deferreds = []
+        for topic, options in self._subscriptions():
+            args = (topic,) if options is None else (topic, options)
+            deferreds.append(maybeDeferred(session.subscribe, self._receive_sync_event, *args))
+        return gatherResults(deferreds, consumeErrors=True)
+
+    def _event_topic(self, topic, op, args):  #pylint: disable=unused-argument
+        """Returns the topic the event of an operation is published on,
+        models override this to publish some operations on sub-topics.
+
+        """
+        return topic
+
+    def _sync_filter(self):
+        """Returns the filter a replica passes to sync_since, or None
+        to replicate the whole object.
+
+        """
+        return None
+
+    def _sync_args(self, since):
+        """Returns the arguments a replica calls sync_since with."""
+        key_filter = self._sync_filter()
+        if key_filter is None:
+            return since, self.chunk_size is None
+        return since, True, key_filter
+
+    def _sync_kwargs(self):
+        """Returns the keyword arguments a replica calls sync_since with."""
+        if not self.accept_encodings:
+            return {}
+        return {'accept_encodings': list(self.accept_encodings)}
+
+    def _filtered_state(self, key_filter, codec=None):
+        """Returns the dump_state payload of the part of the object
+        that matches a filter returned by _sync_filter.
+
+        """
+        raise NotImplementedError("{} does not support filtered replicas.".format(type(self).__name__))
+
     @contextlib.contextmanager
     def block_propagation(self):
         """
@@ -138,80 +606,915 @@ class Publisher(object):
                 synclist.clear()
         
         """
+        propagate = self._propagate
         self._propagate = False
-        yield
-        self._propagate = True
+        try:
+            yield
+        finally:
+            self._propagate = propagate
+
+    @contextlib.contextmanager
+    def batch(self, options=PublishOptions()):
+        """
+        Context manager that coalesces sync events into a single publish.
+
+        Methods decorated with method_publish are still applied locally,
+        but instead of publishing one event per call, the calls are
+        recorded and published as one compound event when the outermost
+        batch exits. Replicas apply the whole batch with apply_batch.
+
+        Note:
+            Local changes cannot be rolled back, so the recorded calls
+            are published even if the block raises.
+
+        Args:
+            options (PublishOptions): The publish options used for the
+                compound event.
+
+        Example:
+            with synclist.batch():
+                for color in colors:
+                    synclist.append(color)
+
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+        finally:
+            calls, self._batch = self._batch, None
+            if calls and self._propagate:
+                self._publish(self.uri, options, self._op_codes['apply_batch'], (calls,))
+
+    def apply_path(self, path, method_name, args):
+        """Applies an operation published by a model nested in this one.
+
+        Args:
+            path (list): The keys from this object to the nested model.
+            method_name (unicode): The name of the method_publish method
+                called on the nested model.
+            args (list): The arguments of the call.
+
+        Raises:
+            ValueError: If the method cannot be applied to the value at path.
+
+        """
+        node = owner = self
+        parent = key = None
+        for key in path:
+            parent, node = node, node[key]
+            if isinstance(node, Publisher):
+                owner = node
+        if isinstance(node, Publisher):
+            try:
+                op = node._op_codes[method_name]
+            except KeyError:
+                raise ValueError("Unknown method {!r} for {}.".format(
+                    method_name, type(node).__name__))
+            node._call_op(op, args)
+        elif method_name == 'clear' and isinstance(node, collections.MutableSequence):
+            del node[:]
+        elif method_name in _plain_methods:
+            method = _plain_methods[method_name]
+            if isinstance(method, basestring):
+                getattr(node, method)(*args)
+            else:
+                method(parent, key, *args)
+        else:
+            raise ValueError("Unknown method {!r} for {}.".format(
+                method_name, type(node).__name__))
+        if not isinstance(node, Publisher):
+            owner._mark_dirty()
+
+    def _send(self, topic, options, op, args, kwargs=None):
+        """Records the call in the current batch, or publishes it.
+
+        Pending conflated calls are sent first so replicas apply
+        the calls in the order they were made.
+
+        """
+        if self._conflated:
+            self.flush()
+        if self._batch is not None:
+            self._batch.append([op, list(args)])
+        else:
+            self._publish(topic, options, op, args, kwargs)
+
+    def _send_conflated(self, key, topic, options, op, args, kwargs=None):
+        """Holds a call until the next flush, replacing any pending call
+        of the same method with the same key.
+
+        Calls with unhashable keys, like slices, are sent right away.
+
+        """
+        key = self._conflation_key(key)
+        try:
+            replaced = (op, key) in self._conflated
+        except TypeError:
+            self._send(topic, options, op, args, kwargs)
+            return
+        self._conflated[(op, key)] = (topic, options, op, args, kwargs)
+        if replaced and self.instrumentation.enabled:
+            self.instrumentation.count('conflated')
+        if self._flush_call is None:
+            self._flush_call = self._get_clock().callLater(self.conflate_interval, self.flush)
+
+    def _conflation_key(self, key):
+        """Returns the key conflated calls are grouped by, models
+        override this so different spellings of a key match.
+
+        """
+        return key
+
+    def _get_clock(self):
+        """Returns the clock used to schedule calls."""
+        if self.clock is None:
+            from twisted.internet import reactor
+            return reactor
+        return self.clock
+
+    def flush(self):
+        """Sends the pending conflated calls now.
+
+        Called every conflate_interval seconds while calls are pending,
+        it can also be called directly, e.g. from a LoopingCall tick.
+
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        pending, self._conflated = self._conflated, collections.OrderedDict()
+        for topic, options, op, args, kwargs in pending.itervalues():
+            self._send(topic, options, op, args, kwargs)
+
+    def apply_batch(self, calls):
+        """Applies a compound event published by batch.
+
+        Args:
+            calls (list): A list of [op, args] pairs in the
+                order they were called.
+
+        """
+        for op, args in calls:
+            self._call_op(op, args)
+
+    def _call_op(self, op, args):
+        """Calls the method with the op code from the dispatch table.
+
+        Raises:
+            ValueError: If op is not an op code of this class.
+
+        """
+        op_table = self._op_table
+        if not 0 <= op < len(op_table):
+            raise ValueError("Unknown op {!r} for {}.".format(op, type(self).__name__))
+        return op_table[op](self, *args)
+
+    def _publish(self, topic, options, op, args, kwargs=None):
+        """Publishes a method call to all of the subscribed sessions.
+
+        Args:
+            topic (unicode): The full URI to publish to.
+            options (PublishOptions): The options used with subscriber.publish.
+            op (int): The op code of the method replicas will call.
+            args (tuple): The positional arguments of the method call.
+            kwargs (dict): Extra keyword arguments to publish.
+
+        """
+        topic, args, kwargs = self._event(topic, options, op, args, kwargs)
+        if self.publish_queue_size is None:
+            self._fan_out(topic, args, kwargs)
+        else:
+            self._enqueue(topic, args, kwargs)
+
+    def _event(self, topic, options, op, args, kwargs=None):
+        """Returns the topic, args and kwargs of the event of a call,
+        assigning it a version if this is the main session or an origin
+        token if this is a client.
+
+        Objects added to a PublisherHub publish on the topic of the hub,
+        with the uri of the object as the 'target'.
+
+        """
+        kwargs = dict(kwargs) if kwargs else {}
+        kwargs['options'] = options
+        kwargs['op'] = op
+        if self._authoritative:
+            kwargs['version'] = self._record_op(op, args, kwargs.get('origin'))
+        else:
+            kwargs['origin'] = self._new_origin()
+        topic = self._event_topic(topic, op, args)
+        if (self.compression is not None and self._op_names[op] in self._compress_ops
+                and self.compression in (self._event_encodings or ())):
+            args = self._pack_event(args, kwargs)
+        if self._hub is not None:
+            topic = self._hub.topic
+            kwargs['target'] = self.uri
+        return topic, args, kwargs
+
+    def _pack_event(self, args, kwargs):
+        """Compresses the arguments of a bulk event into kwargs['packed']
+        if they are large enough.
+
+        Returns:
+            list: The arguments left to publish.
+
+        """
+        codec = self._get_codec()
+        packed = pack(codec.encode(list(args)), self.compression,
+                      self.compression_threshold, self._compression_stats)
+        if not isinstance(packed, dict):
+            return args
+        packed[u'codec'] = codec.name
+        kwargs['packed'] = packed
+        return []
+
+    def _enqueue(self, topic, args, kwargs):
+        """Adds an event to the publish queue, applying the
+        overflow_policy if the queue is full.
+
+        """
+        queue = self._queue
+        if len(queue) >= self.publish_queue_size:
+            if self.overflow_policy == u'drop_oldest':
+                while len(queue) >= self.publish_queue_size:
+                    queue.popleft()
+                    self._queue_stats['dropped'] += 1
+            elif self.overflow_policy == u'resync':
+                queue.clear()
+                self._queue_stats['resyncs'] += 1
+                topic, args, kwargs = self._event(
+                    self.uri, PublishOptions(), self._op_codes['load_state'],
+                    [self.snapshot(), self.codec])
+            elif self.overflow_policy == u'block':
+                while len(queue) >= self.publish_queue_size:
+                    self._fan_out(*queue.popleft())
+                    self._queue_stats['drained'] += 1
+            else:
+                raise ValueError("Unknown overflow_policy {!r}.".format(self.overflow_policy))
+        queue.append((topic, args, kwargs))
+        if self._drain_call is None:
+            self._drain_call = self._get_clock().callLater(0, self._drain)
+
+    def _drain(self):
+        """Publishes up to drain_size queued events, and schedules
+        itself again if events are left.
+
+        """
+        self._drain_call = None
+        queue = self._queue
+        start = timeit.default_timer()
+        count = min(self.drain_size, len(queue))
+        for _ in xrange(count):
+            self._fan_out(*queue.popleft())
+        elapsed = timeit.default_timer() - start
+        self._queue_stats['drained'] += count
+        if elapsed:
+            self._drain_rate = count / elapsed
+        if self.instrumentation.enabled:
+            self.instrumentation.count('queue_drained', count)
+        if queue:
+            self._drain_call = self._get_clock().callLater(0, self._drain)
+
+    def flush_queue(self):
+        """Publishes every queued event now."""
+        if self._drain_call is not None:
+            if self._drain_call.active():
+                self._drain_call.cancel()
+            self._drain_call = None
+        count = len(self._queue)
+        while self._queue:
+            self._fan_out(*self._queue.popleft())
+        self._queue_stats['drained'] += count
+
+    @property
+    def publish_queue_stats(self):
+        """dict: The current 'depth' and 'maxlen' of the publish queue, the
+        total events 'drained' and 'dropped', the number of 'resyncs', and
+        the 'drain_rate' in events per second of the last drain.
+
+        """
+        return {u'depth': len(self._queue),
+                u'maxlen': self.publish_queue_size,
+                u'drained': self._queue_stats['drained'],
+                u'dropped': self._queue_stats['dropped'],
+                u'resyncs': self._queue_stats['resyncs'],
+                u'drain_rate': self._drain_rate}
+
+    def _fan_out(self, topic, args, kwargs):
+        """Publishes an event to every subscribed session."""
+        if (self.share_payloads and args and 'packed' not in kwargs and len(self._subscribers) > 1
+                and kwargs.get('op') != self._op_codes['load_state']):
+            args, kwargs = self._share_payload(args, kwargs)
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            start = timeit.default_timer()
+        publishes = failures = transport_lost = 0
+        for subscriber in self.subscribers:
+            try:
+                subscriber.publish(topic, *args, **kwargs)
+            except TransportLost as error:
+                transport_lost += 1
+                instrumentation.failure('transport_lost', error)
+            except Exception as error:  #pylint: disable=broad-except
+                failures += 1
+                instrumentation.failure('publish_failures', error)
+            else:
+                publishes += 1
+        if instrumentation.enabled:
+            instrumentation.observe('fanout_seconds', timeit.default_timer() - start)
+            instrumentation.count('publishes', publishes)
+            if failures or transport_lost:
+                instrumentation.count('publish_failures', failures + transport_lost)
+                instrumentation.count('transport_lost', transport_lost)
+
+    def _share_payload(self, args, kwargs):
+        """Returns the args and kwargs of an event with the arguments
+        encoded once in kwargs['packed'].
+
+        The full state of load_state is already a payload and is not
+        encoded again.
+
+        """
+        codec = self._get_codec()
+        kwargs = dict(kwargs)
+        kwargs['packed'] = {u'codec': codec.name, u'data': codec.encode(list(args))}
+        return (), kwargs
+
+    def _count_bytes(self, payload):
+        """Reports the size of a state payload sent to clients."""
+        if self.instrumentation.enabled:
+            if isinstance(payload, dict):
+                payload = payload[u'data']
+            self.instrumentation.count('bytes', len(payload))
 
     def _receive_sync_event(self, *args, **kwargs):
         """When published events are propagated from a synced instance
         in another session this method is called and we call
         the same method on this instance.
 
+        Events carry the 'op' code of the method, events with a 'method'
+        name are still accepted if the name is in the dispatch table.
+        Clients skip versioned events the fetched state already contains,
+        the changes of other clients until the main session publishes
+        them with a version, and their own changes published back. The
+        main session publishes the changes of clients again.
+        A client that receives a version further ahead than the next one
+        lost events, it fetches what it missed with _resync instead,
+        unless the event carries the full state.
+
+        Raises:
+            KeyError: If the event has neither 'op' nor a known 'method'.
+            ValueError: If the op code is unknown.
+
         """
-        if 'method' not in kwargs:
-            raise KeyError("kwargs must have 'method' key.")
-        method_name = kwargs['method']
-        method = getattr(self, method_name)
+        if self._pending_events is not None:
+            self._pending_events.append((args, kwargs))
+            return
+        version = kwargs.get('version')
+        origin = kwargs.get('origin')
+        if not self._authoritative:
+            if version is None and origin is not None:
+                return
+            if version is not None and version <= self._version:
+                return
+            if (version is not None and version > self._version + 1
+                    and not self._is_full_state(kwargs) and self._can_resync()):
+                self._pending_events = [(args, kwargs)]
+                self._resync()
+                return
+            if origin is not None and self._acknowledge(origin):
+                self._version = version
+                return
+        packed = kwargs.get('packed')
+        if packed is not None:
+            args = self._get_codec(packed[u'codec']).decode(unpack(packed, self._compression_stats))
+        op = kwargs.get('op')
+        if op is None:
+            try:
+                op = self._op_codes[kwargs['method']]
+            except KeyError:
+                raise KeyError("kwargs must have an 'op' or a known 'method' key.")
         with self.block_propagation():
-            return method(*args)
+            return_value = self._call_op(op, args)
+        if self.instrumentation.enabled:
+            self.instrumentation.count('events_applied')
+        if not self._authoritative:
+            if version is not None:
+                self._version = version
+        elif origin is None:
+            self._record_op(op, args)
+        else:
+            self._send(self.uri, PublishOptions(), op, args, {'origin': origin})
+        return return_value
+
+    def _is_full_state(self, kwargs):
+        """Tells if an event replaces the whole state, so a client
+        applies it whatever versions it missed.
+
+        """
+        op = kwargs.get('op')
+        if op is None:
+            return kwargs.get('method') in self._full_state_ops
+        try:
+            return self._op_names[op] in self._full_state_ops
+        except (IndexError, TypeError):
+            return False
+
+    def _can_resync(self):
+        """Returns True if this client can fetch the events it missed,
+        partial replicas skip versions by design and cannot.
+
+        """
+        return self._connected and bool(self._subscribers) and self._sync_filter() is None
+
+    @inlineCallbacks
+    def _resync(self):
+        """Catches a client up after it lost events, with the operations
+        it missed or the state.
+
+        Events received meanwhile are buffered in _pending_events and
+        replayed afterwards. If the fetch fails the buffered events are
+        dropped, and the next event starts another catch up.
+
+        """
+        if self.instrumentation.enabled:
+            self.instrumentation.count('resyncs')
+        session = next(self.subscribers)
+        try:
+            if self._hub is None:
+                sync_topic = self.uri + "." + self.sync_since.__name__
+                result = yield session.call(sync_topic, *self._sync_args(self._version),
+                                            **self._sync_kwargs())
+            else:
+                results = yield session.call(self._hub.procedure, {self.uri: self._version},
+                                             **self._sync_kwargs())
+                result = results[self.uri]
+            self._accept_main_encodings(result)
+            if u'ops' not in result and u'state' not in result:
+                result = yield self._fetch_chunks(session)
+            state = yield self._decode_state(result)
+        except Exception:
+            self._pending_events = None
+            raise
+        self._apply_sync(result, state)
+
+    def _record_op(self, op, args, origin=None):
+        """Assigns the next version to an operation and appends it
+        to the operation log, along with the origin token of the client
+        that made it if there is one.
+
+        Returns:
+            int: The version of the operation.
+
+        """
+        self._version += 1
+        entry = (self._version, op, list(args))
+        self._oplog.append(entry if origin is None else entry + (origin,))
+        if self._journal is not None:
+            self._journal.append(self._version, op, args, origin)
+        return self._version
+
+    def _new_origin(self):
+        """Returns a new token for a change made by this client, which
+        is remembered until the main session publishes the change back.
+
+        """
+        origin = u'{}.{}'.format(self._origin_prefix, next(self._origin_ids))
+        self._originated[origin] = None
+        return origin
+
+    def _acknowledge(self, origin):
+        """Tells if a change published by the main session was made,
+        and so already applied, by this client.
+
+        The main session publishes the changes of a client in the order
+        they were made, the tokens of older changes that did not come
+        back were lost on the way and are forgotten.
+
+        """
+        if origin not in self._originated:
+            return False
+        while self._originated.popitem(last=False)[0] != origin:
+            pass
+        return True
+
+    def _serve_sync_since(self, version=None, with_state=True, key_filter=None,
+                          accept_encodings=None):
+        """The procedure registered as sync_since, which encodes the
+        state in snapshot_pool when it is set, and negotiates the
+        compression of events with the calling client.
+
+        Returns:
+            Deferred(dict): The sync_since result.
+
+        """
+        if self.snapshot_pool is None or not with_state or key_filter is not None:
+            return succeed(self._negotiate_encodings(
+                self.sync_since(version, with_state, key_filter, accept_encodings),
+                accept_encodings))
+        result = self._negotiate_encodings(self.sync_since(version, False), accept_encodings)
+        if u'ops' in result:
+            return succeed(result)
+        encoding = choose_compressor(accept_encodings)
+        serial = self._state_serial
+
+        def reply(payload):
+            if serial == self._state_serial:
+                payload = self._packed_snapshot(encoding)
+            else:
+                payload = pack(payload, encoding, self.compression_threshold,
+                               self._compression_stats)
+            self._count_bytes(payload)
+            result.update({u'state': payload, u'codec': self.codec})
+            return result
+        return self.snapshot_async().addCallback(reply)
+
+    def _negotiate_encodings(self, result, accept_encodings):
+        """Narrows the compressors the main session compresses events
+        with to the accept_encodings of a client that syncs, and adds
+        the compressors the main session accepts to its result.
+
+        Returns:
+            dict: The sync_since result.
+
+        """
+        accepted = frozenset(accept_encodings or ())
+        if self._event_encodings is not None:
+            accepted &= self._event_encodings
+        self._event_encodings = accepted
+        result[u'accept_encodings'] = list(self.accept_encodings)
+        return result
+
+    def _accept_main_encodings(self, result):
+        """Compresses the events of a client only with the compressors
+        the main session accepts, as told by a sync_since result.
+
+        """
+        self._event_encodings = frozenset(result.get(u'accept_encodings') or ())
+
+    def sync_since(self, version=None, with_state=True, key_filter=None, accept_encodings=None):
+        """Returns what a replica needs to catch up to this object.
+
+        This method is registered as an RPC by set_main_session. If the
+        operation log still holds every operation after version only those
+        operations are returned, otherwise the full state is returned.
+
+        Args:
+            version (int): The last version the replica applied, or None
+                if the replica has never been synced.
+            with_state (bool): If False the state is never included, the
+                replica fetches it with fetch_range instead.
+            key_filter: The _sync_filter of a partial replica, which is
+                always sent the part of the state it replicates.
+            accept_encodings (list(unicode)): The compressors the replica
+                accepts, a large state is compressed with the first one
+                that is registered.
+
+        Returns:
+            dict: The current 'version' and either 'ops', a list of
+                [version, op, args] followed by the origin token of the
+                operations made by a client, or 'state', the dump_state
+                payload along with the name of its 'codec'.
+
+        """
+        if version is not None and version <= self._version:
+            if version == self._version:
+                return {u'version': self._version, u'ops': []}
+            if key_filter is None and self._oplog and self._oplog[0][0] <= version + 1:
+                ops = [list(op) for op in self._oplog if op[0] > version]
+                return {u'version': self._version, u'ops': ops}
+        encoding = choose_compressor(accept_encodings)
+        if key_filter is not None:
+            payload = pack(self._filtered_state(key_filter), encoding,
+                           self.compression_threshold, self._compression_stats)
+        elif not with_state:
+            return {u'version': self._version}
+        else:
+            payload = self._packed_snapshot(encoding)
+        self._count_bytes(payload)
+        return {u'version': self._version,
+                u'state': payload,
+                u'codec': self.codec}
+
+    def fetch_range(self, start=0, count=None, transfer=None):
+        """Returns one chunk of the state of the object.
+
+        This method is registered as an RPC by set_main_session. The first
+        call starts a transfer, which reads the items from a cursor over
+        the state instead of a copy, see _state_cursor, so a transfer only
+        holds the chunk being served. Chunks must be fetched in order.
+        A transfer over a frozen version of the state stays consistent
+        while the object keeps changing, any other transfer expires when
+        the object changes and the client starts again. The transfer is
+        released after its last chunk is served.
+
+        Args:
+            start (int): The position of the first item of the chunk, where
+                the previous chunk ended.
+            count (int): The maximum number of items in the chunk, defaults
+                to chunk_size.
+            transfer (int): The id returned by the first call, or None
+                to start a new transfer.
+
+        Returns:
+            dict: The 'transfer' id, the 'version' and 'total' number of
+                items of the transferred state, the 'chunk' payload and its
+                'codec', the 'next' start or None after the last chunk and
+                the 'header' of the state if there is one.
+                If the object changed the transfer is 'expired' and there
+                is no chunk.
+
+        Raises:
+            KeyError: If the transfer was released or does not exist.
+            ValueError: If start is not where the previous chunk ended.
+
+        """
+        if transfer is None:
+            transfer = next(self._transfer_ids)
+            items, total, frozen = self._state_cursor()
+            self._transfers[transfer] = _Transfer(
+                self._version, None if frozen else self._state_serial, total, items,
+                self._state_header())
+            while len(self._transfers) > self.max_transfers:
+                self._transfers.popitem(last=False)
+        try:
+            state = self._transfers[transfer]
+        except KeyError:
+            raise KeyError("Transfer {} expired or does not exist.".format(transfer))
+        if state.serial is not None and state.serial != self._state_serial:
+            del self._transfers[transfer]
+            return {u'transfer': transfer, u'version': state.version, u'expired': True}
+        if start != state.position:
+            raise ValueError("Transfer {} is at item {} not {}.".format(
+                transfer, state.position, start))
+        if count is None:
+            count = self.chunk_size or state.total
+        items = list(itertools.islice(state.items, count))
+        end = state.position = start + len(items)
+        if end >= state.total or len(items) < count:
+            del self._transfers[transfer]
+            end = None
+        chunk = self._get_codec().encode(items)
+        self._count_bytes(chunk)
+        page = {u'transfer': transfer,
+                u'version': state.version,
+                u'total': state.total,
+                u'next': end,
+                u'chunk': chunk,
+                u'codec': self.codec}
+        if state.header is not None:
+            page[u'header'] = state.header
+        return page
+
+    @inlineCallbacks
+    def _fetch_chunks(self, session):
+        """Fetches the state from the main session one chunk at a time
+        with fetch_range, loading each chunk as it arrives.
+
+        An expired transfer is started again, up to transfer_restarts
+        times, then the state is fetched in one snapshot.
+
+        Returns:
+            Deferred(dict): A sync_since result with the version of
+                the fetched state, or with the state itself.
+
+        """
+        fetch_topic = self.uri + "." + self.fetch_range.__name__
+        for _ in xrange(self.transfer_restarts + 1):
+            start, transfer, first = 0, None, True
+            while start is not None:
+                page = yield session.call(fetch_topic, start, self.chunk_size, transfer)
+                transfer = page[u'transfer']
+                if page.get(u'expired'):
+                    break
+                if u'header' in page:
+                    self._load_header(page[u'header'])
+                self._load_chunk(self._get_codec(page[u'codec']).decode(page[u'chunk']), first)
+                first = False
+                start = page[u'next']
+            else:
+                returnValue({u'version': page[u'version'], u'ops': []})
+        sync_topic = self.uri + "." + self.sync_since.__name__
+        result = yield session.call(sync_topic, None, True, **self._sync_kwargs())
+        returnValue(result)
+
+    def _decode_state(self, result):
+        """Decodes the state of a sync_since result in snapshot_pool.
+
+        Returns:
+            Deferred: The decoded state, or None if there is no state or
+                no snapshot_pool, load_state decodes it instead.
+
+        """
+        if self.snapshot_pool is None or u'state' not in result:
+            return succeed(None)
+        payload = unpack(result[u'state'], self._compression_stats)
+        result[u'state'] = payload
+        return self.snapshot_pool.run(decode_payload, result.get(u'codec', u'json'),
+                                      payload, self._object_pairs_hook)
+
+    def _apply_sync(self, result, state=None):
+        """Applies the result of sync_since and then replays the events
+        that were buffered while the result was being fetched.
+
+        Args:
+            result (dict): The return value of sync_since.
+            state: The state of the result already decoded by _decode_state.
+
+        """
+        pending, self._pending_events = self._pending_events, None
+        if u'state' in result:
+            self._load_sync_state(result, state)
+            self._originated.clear()
+        else:
+            with self.block_propagation():
+                for entry in result[u'ops']:
+                    if len(entry) > 3 and self._acknowledge(entry[3]):
+                        continue
+                    self._call_op(entry[1], entry[2])
+        self._version = result[u'version']
+        for args, kwargs in pending or ():
+            self._receive_sync_event(*args, **kwargs)
+
+    def _load_sync_state(self, result, state):
+        """Installs the decoded state of a sync_since result, or decodes
+        it with load_state if it was not decoded or cannot be installed.
+
+        """
+        if state is not None:
+            try:
+                return self._install_state(state)
+            except NotImplementedError:
+                pass
+        self.load_state(unpack(result[u'state'], self._compression_stats),
+                        result.get(u'codec', u'json'))
 
     def broadcast_sync(self):
         """Publishes a entire sync event to all current subscribers."""
-        @method_publish()
-        def set_json(self, json_string):
-            pass
-        set_json(self, self.as_json())
+        if not self._propagate:
+            return
+        op = self._op_codes['load_state']
+        args = [self.snapshot(), self.codec]
+        self._count_bytes(args[0])
+        self._send(self.uri, PublishOptions(), op, args)
         
     @inlineCallbacks
     def set_main_session(self, session):
         """Sets the main session of the Sync list, basically
         the mothership server.
+
+        The state is broadcast to the clients unless it was restored
+        by a Journal, which the clients already have.
         
         Args:
             session (ApplicationSession): The twisted session connected
                 to the router.
         
         """
+        self._authoritative = True
         yield self.subscribe(session)
         update_method_name = self.as_json.__name__
         get_state_topic = self.uri + "." + update_method_name
         yield session.register(getattr(self, update_method_name), get_state_topic)
-        yield session.subscribe(self._receive_sync_event, self.uri)  #pylint: disable=protected-access
-        self.broadcast_sync()
+        sync_topic = self.uri + "." + self.sync_since.__name__
+        yield session.register(self._serve_sync_since, sync_topic)
+        fetch_topic = self.uri + "." + self.fetch_range.__name__
+        yield session.register(self.fetch_range, fetch_topic)
+        yield self._subscribe_events(session)
+        if self._journal is None or self._journal.restored_version is None:
+            self.broadcast_sync()
         self._connected = True  #pylint: disable=protected-access
         returnValue(self)
 
     @inlineCallbacks
     def set_client_session(self, session):
         """Sets a client session of the data stcuture.
+
+        Events received while the state is being fetched are buffered
+        and replayed afterwards, skipping the ones the fetched state
+        already contains. A client that was connected before only
+        fetches the operations it missed. If chunk_size is set the state
+        is fetched in chunks with fetch_range.
         
         Args:
             session (ApplicationSession): The twisted session connected
                 to the router.
         
         """
-
-        yield session.subscribe(self._receive_sync_event, self.uri)  #pylint: disable=protected-access
-        update_method_name = self.as_json.__name__
-        original_state_topic = self.uri + "." + update_method_name
-        json_string = yield session.call(original_state_topic)
-        self.set_json(json_string)
+        self._authoritative = False
+        self._pending_events = []
+        try:
+            yield self._subscribe_events(session)
+            since = self._version if self._connected else None
+            sync_topic = self.uri + "." + self.sync_since.__name__
+            result = yield session.call(sync_topic, *self._sync_args(since), **self._sync_kwargs())
+            self._accept_main_encodings(result)
+            if u'ops' not in result and u'state' not in result:
+                result = yield self._fetch_chunks(session)
+            state = yield self._decode_state(result)
+        except Exception:
+            self._pending_events = None
+            raise
+        self._apply_sync(result, state)
         yield self.subscribe(session)
         self._connected = True  #pylint: disable=protected-access
         returnValue(self)
 
 
-def method_publish(topic=u"", options=PublishOptions()):
+class _Transfer(object):
+    """A chunked transfer served by fetch_range.
+
+    Attributes:
+        version (int): The version of the object when the transfer started.
+        serial (int): The _state_serial of the object when the transfer
+            started, or None if the items are read from a frozen version.
+        total (int): The number of items transferred.
+        position (int): The number of items already served.
+        items (iterator): The cursor over the items left to serve.
+        header: The _state_header of the object when the transfer started.
+
+    """
+
+    def __init__(self, version, serial, total, items, header=None):
+        self.version = version
+        self.serial = serial
+        self.total = total
+        self.position = 0
+        self.items = items
+        self.header = header
+
+
+_plain_methods = {
+    '__setitem__': '__setitem__',
+    '__delitem__': '__delitem__',
+    '_extend': 'extend',
+    '_update': 'update',
+    'clear': 'clear',
+    'insert': 'insert',
+    'pop': 'pop',
+    'remove': 'remove',
+    'reverse': 'reverse',
+    'sort': 'sort',
+    }
+"""dict: Maps the method_publish methods of the models to the methods of
+plain lists and dicts, or to functions registered with
+register_plain_method, used by apply_path on replicas that hold nested
+models as plain containers."""
+
+
+def register_plain_method(method_name, func):
+    """Registers how replicas apply a method_publish method of a nested
+    model they hold as a plain container, replacing any function
+    registered for the same name.
+
+    Args:
+        method_name (str): The name of the method_publish method.
+        func (callable): Called with the container holding the plain
+            value, the key of the value and the arguments of the call.
+            It updates the value in place or stores a new value under
+            the key.
+
+    """
+    if not callable(func):
+        raise TypeError("func must be callable not {}.".format(type(func)))
+    _plain_methods[method_name] = func
+
+
+def _plain(value):
+    """Returns value with every Publisher in it replaced by the plain
+    containers of its state, as they are encoded in the state of the
+    model they are nested in.
+
+    """
+    if isinstance(value, Publisher):
+        codec = get_codec(u'json')
+        return codec.decode(codec.encode(value))
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _plain(item)) for key, item in value.iteritems())
+    return value
+
+
+def method_publish(topic=u"", options=PublishOptions(), conflate=False):
     """A function that returns a publishing decorator.
 
     When creating a Publisher subclass, use this function to decorate
     methods you intend to publish. When the method is called, both the
-    method name, and the arguments are published to the topic.
+    op code of the method, and the arguments are published to the topic.
 
     Args:
         topic (unicode): The URI topic that the method will call on publish.
             This topic is appened to the Publishers .topic.
         options (PublishOptions): The publish options used with subscriber.publish
+        conflate (bool): If True and the Publisher has a conflate_interval, only
+            the latest call for each value of the first argument, the key, is
+            published on the next flush. Only use it on methods where the
+            latest call makes the earlier calls with the same key obsolete.
 
     Returns:
         callable: The function intended to decorate a method of a Publisher subclass.
@@ -237,8 +1540,9 @@ def method_publish(topic=u"", options=PublishOptions()):
             #The *args
             ("Hello World, ),
 
-            #The **kwargs along with 'method' and 'options'
-            {'method': 'set_message',
+            #The **kwargs along with 'op', 'version' and 'options'
+            {'op': DailyMessage._op_codes['set_message'],
+            'version': 1,
             'options': <PublishOptions> instance}
             )
 
@@ -263,25 +1567,107 @@ def method_publish(topic=u"", options=PublishOptions()):
             if not isinstance(self, Publisher):
                 raise TypeError("method_publish must be used on a Publisher subclass. "
                                 "Cannot be used on {}.".format(func.__name__))
-            return_value = func(self, *args, **kwargs)
-            #print func.__name__
-            kwargs['options'] = options
-            kwargs['method'] = func.__name__
-            #print self, len(self.subscribers), self.subscribers
+            instrumentation = self.instrumentation
+            if instrumentation.enabled:
+                start = timeit.default_timer()
+                return_value = func(self, *args, **kwargs)
+                instrumentation.observe('apply_seconds', timeit.default_timer() - start)
+            else:
+                return_value = func(self, *args, **kwargs)
+            self._mark_dirty()  #pylint: disable=protected-access
+            if self._has_children:  #pylint: disable=protected-access
+                args = [_plain(arg) for arg in args]
+            if self._parent is not None:  #pylint: disable=protected-access
+                root, path = self._path()  #pylint: disable=protected-access
+                if path:
+                    if root._propagate:  #pylint: disable=protected-access
+                        root._send(root.uri, options, root._op_codes['apply_path'],  #pylint: disable=protected-access
+                                   [path, func.__name__, list(args)])
+                    return return_value
             if self._propagate:  #pylint: disable=protected-access
+                op = self._op_codes[func.__name__]  #pylint: disable=protected-access
                 if not topic:
                     pub_topic = self.uri
                 else:
                     pub_topic = "{base}.{topic}".format(base=self.uri, topic=topic)
-                    print pub_topic, self, args, kwargs
-                for subscriber in self.subscribers:
-                    try:
-                        subscriber.publish(pub_topic, *args, **kwargs)
-                        print "Pub topic", pub_topic
-                    except TransportLost as e:
-                        print e
-                    except Exception as e:
-                        print e
+                if conflate and args and self.conflate_interval is not None:
+                    self._send_conflated(args[0], pub_topic, options, op, args, kwargs)  #pylint: disable=protected-access
+                else:
+                    self._send(pub_topic, options, op, args, kwargs)  #pylint: disable=protected-access
             return return_value
+        publish_after._method_publish = True  #pylint: disable=protected-access
         return publish_after
     return publish_decorator
+
+
+@inlineCallbacks
+def attach_clients(session, publishers):
+    """Sets the client session of many Publishers at once.
+
+    Unlike calling set_client_session on each object, which waits for
+    one subscription and one call after another, every subscription is
+    sent at once and then every sync_since call, so attaching takes
+    about two round trips however many objects there are. Objects added
+    to a PublisherHub are fetched together with one call of the hub
+    procedure.
+
+    Args:
+        session (ApplicationSession): The twisted session connected
+            to the router.
+        publishers (iterable(Publisher)): The client replicas to attach.
+
+    Returns:
+        Deferred(list(Publisher)): The attached publishers.
+
+    """
+    publishers = list(publishers)
+    hubs = collections.OrderedDict()
+    singles = []
+    for publisher in publishers:
+        publisher._authoritative = False  #pylint: disable=protected-access
+        publisher._pending_events = []  #pylint: disable=protected-access
+        if publisher._hub is None:  #pylint: disable=protected-access
+            singles.append(publisher)
+        else:
+            hubs.setdefault(publisher._hub, []).append(publisher)  #pylint: disable=protected-access
+
+    def since(publisher):
+        return publisher._version if publisher._connected else None  #pylint: disable=protected-access
+
+    try:
+        yield gatherResults(
+            [publisher._subscribe_events(session) for publisher in singles] +  #pylint: disable=protected-access
+            [session.subscribe(hub._receive_event, hub.topic) for hub in hubs],  #pylint: disable=protected-access
+            consumeErrors=True)
+        calls = [session.call(publisher.uri + "." + publisher.sync_since.__name__,
+                              *publisher._sync_args(since(publisher)),  #pylint: disable=protected-access
+                              **publisher._sync_kwargs())  #pylint: disable=protected-access
+                 for publisher in singles]
+        calls.extend(session.call(hub.procedure,
+                                  dict((member.uri, since(member)) for member in members),
+                                  **members[0]._sync_kwargs())  #pylint: disable=protected-access
+                     for hub, members in hubs.iteritems())
+        replies = yield gatherResults(calls, consumeErrors=True)
+        results = dict((id(publisher), result) for publisher, result in zip(singles, replies))
+        for members, hub_results in zip(hubs.itervalues(), replies[len(singles):]):
+            results.update((id(member), hub_results[member.uri]) for member in members)
+        for publisher in publishers:
+            publisher._accept_main_encodings(results[id(publisher)])  #pylint: disable=protected-access
+        chunked = [publisher for publisher in singles
+                   if u'ops' not in results[id(publisher)] and u'state' not in results[id(publisher)]]
+        fetched = yield gatherResults([publisher._fetch_chunks(session)  #pylint: disable=protected-access
+                                       for publisher in chunked], consumeErrors=True)
+        results.update((id(publisher), result) for publisher, result in zip(chunked, fetched))
+        states = yield gatherResults([publisher._decode_state(results[id(publisher)])  #pylint: disable=protected-access
+                                      for publisher in publishers], consumeErrors=True)
+    except Exception:
+        for publisher in publishers:
+            publisher._pending_events = None  #pylint: disable=protected-access
+        raise
+    for publisher, state in zip(publishers, states):
+        publisher._apply_sync(results[id(publisher)], state)  #pylint: disable=protected-access
+        publisher.subscribe(session)
+        publisher._connected = True  #pylint: disable=protected-access
+    for hub in hubs:
+        hub._client_attached(session)  #pylint: disable=protected-access
+    returnValue(publishers)
@@ -0,0 +1,188 @@
+"""This module contains the codecs used to serialize Publisher state.
+
+A codec turns the container of a Publisher model into a payload that
+can be sent through a session, and turns the payload back into a
+container. Codecs are registered by name and each Publisher picks one
+with its codec attribute.
+
+Note:
+    Binary codecs return bytes, so the WAMP transport must use a
+    serializer that carries bytes, such as msgpack or cbor.
+
+"""
+import array
+import collections
+import json
+import timeit
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _encode_default(obj):
+    """Encodes objects the codecs do not know natively, such as
+    nested Publisher models.
+
+    Raises:
+        TypeError: If the object cannot be converted.
+
+    """
+    container = getattr(obj, '_container', None)
+    if container is not None:
+        return container
+    if isinstance(obj, array.array):
+        return obj.tolist()
+    if isinstance(obj, collections.Mapping):
+        return dict(obj)
+    if isinstance(obj, (collections.Sequence, collections.Set)):
+        return list(obj)
+    raise TypeError("Cannot encode {}.".format(type(obj)))
+
+
+class Codec(object):
+    """Base class of a codec.
+
+    Attributes:
+        name (unicode): The name the codec is registered under.
+        binary (bool): True if payloads are bytes instead of unicode.
+
+    """
+    name = None
+    binary = False
+
+    def encode(self, obj):
+        """Returns the payload of obj."""
+        raise NotImplementedError("You must impliment encode in a subclass.")
+
+    def decode(self, payload, object_pairs_hook=None):
+        """Returns the object of a payload.
+
+        Args:
+            payload (unicode or bytes): A payload returned by encode.
+            object_pairs_hook (callable): Called with the pairs of every
+                decoded mapping, used to preserve order.
+
+        """
+        raise NotImplementedError("You must impliment decode in a subclass.")
+
+
+class JSONCodec(Codec):
+    """Codec that encodes to a JSON unicode string.
+
+    The json module returns str instead of unicode when every value is
+    ASCII, encode always returns unicode so payloads are told apart from
+    binary ones.
+
+    """
+    name = u'json'
+    binary = False
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(ensure_ascii=False, default=_encode_default)
+
+    def encode(self, obj):
+        payload = self._encoder.encode(obj)
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        return payload
+
+    def decode(self, payload, object_pairs_hook=None):
+        return json.loads(payload, object_pairs_hook=object_pairs_hook)
+
+
+class MsgPackCodec(Codec):
+    """Codec that encodes to MessagePack bytes.
+
+    Raises:
+        ImportError: If msgpack is not installed.
+
+    """
+    name = u'msgpack'
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack must be installed to use MsgPackCodec.")
+
+    def encode(self, obj):
+        return msgpack.packb(obj, default=_encode_default, use_bin_type=True)
+
+    def decode(self, payload, object_pairs_hook=None):
+        return msgpack.unpackb(payload, raw=False, object_pairs_hook=object_pairs_hook)
+
+
+_codecs = {}
+
+
+def register_codec(codec):
+    """Registers a codec under its name, replacing any codec
+    with the same name.
+
+    Args:
+        codec (Codec): The codec instance.
+
+    """
+    if not isinstance(codec, Codec):
+        raise TypeError("codec must be a Codec not {}.".format(type(codec)))
+    _codecs[codec.name] = codec
+
+
+def get_codec(name):
+    """Returns the codec registered under name.
+
+    Raises:
+        ValueError: If no codec is registered under name.
+
+    """
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError("No codec is registered as {!r}.".format(name))
+
+
+def available_codecs():
+    """Returns a sorted list of the registered codec names."""
+    return sorted(_codecs)
+
+
+def benchmark_codecs(obj, names=None, number=10):
+    """Measures the payload size and speed of codecs on obj.
+
+    Args:
+        obj: The object to encode, usually the container of a model.
+        names (iterable): The codec names to measure, all registered
+            codecs by default.
+        number (int): How many times to encode and decode.
+
+    Returns:
+        dict: Maps each codec name to a dict with the payload 'size' in
+            bytes and the average 'encode_seconds' and 'decode_seconds'.
+
+    """
+    results = {}
+    timer = timeit.default_timer
+    for name in names or available_codecs():
+        codec = get_codec(name)
+        start = timer()
+        for _ in xrange(number):
+            payload = codec.encode(obj)
+        encode_seconds = (timer() - start) / number
+        start = timer()
+        for _ in xrange(number):
+            codec.decode(payload)
+        decode_seconds = (timer() - start) / number
+        if isinstance(payload, unicode):
+            size = len(payload.encode('utf-8'))
+        else:
+            size = len(payload)
+        results[name] = {u'size': size,
+                         u'encode_seconds': encode_seconds,
+                         u'decode_seconds': decode_seconds}
+    return results
+
+
+register_codec(JSONCodec())
+if msgpack is not None:
+    register_codec(MsgPackCodec())
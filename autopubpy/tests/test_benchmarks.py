@@ -0,0 +1,23 @@
+from __future__ import unicode_literals
+import os
+import subprocess
+import sys
+import autopubpy
+import autopubpy.benchmarks
+
+
+def test_run_and_compare():
+    results = autopubpy.benchmarks.run(sizes=[10], subscribers=[2], operations=5, repeat=1)
+    names = set(result['name'] for result in results['results'])
+    assert names == set(autopubpy.benchmarks.available_benchmarks())
+    comparison = autopubpy.benchmarks.compare(results, results)
+    assert len(comparison) == len(names)
+    assert not any(item['regression'] for item in comparison)
+
+
+def test_benchmarks_registered_on_import():
+    names = subprocess.check_output(
+        [sys.executable, '-c', 'import autopubpy.benchmarks as benchmarks; '
+                               'print(" ".join(benchmarks.available_benchmarks()))'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(autopubpy.__file__))))
+    assert 'list_insert' in names.split()
@@ -0,0 +1,42 @@
+"""These tests do not use unicode_literals, the JSON payloads of ASCII
+data are then str on python 2.
+
+"""
+import autopubpy.models
+from autopubpy.compression import pack, unpack
+from autopubpy.hub import PublisherHub
+from autopubpy.loopback import LoopbackRouter
+from autopubpy.serialization import get_codec
+
+
+def test_ascii_json_payload_is_text():
+    payload = get_codec('json').encode(range(5000))
+    assert isinstance(payload, unicode)
+    packed = pack(payload, 'zlib', 256)
+    assert packed['text']
+    assert unpack(packed) == payload
+
+
+class CompressedList(autopubpy.models.SyncList):
+    compression = 'zlib'
+    compression_threshold = 256
+
+
+def test_compressed_snapshot_and_events():
+    router = LoopbackRouter()
+    main = CompressedList(range(5000), name='numbers')
+    main.set_main_session(router.session())
+    replica = CompressedList(name='numbers')
+    replica.set_client_session(router.session())
+    assert list(replica) == range(5000)
+    main.extend(range(1000))
+    assert list(replica) == list(main)
+    assert replica.compression_stats['decompress_seconds'] > 0
+    hubs = [PublisherHub('com.numbers') for _ in range(2)]
+    for index, hub in enumerate(hubs):
+        hub.add(CompressedList(range(5000) if index == 0 else None,
+                               base_uri='com.numbers', name='items'))
+    hubs[0].set_main_session(router.session())
+    hubs[1].set_client_session(router.session())
+    assert list(hubs[1]['com.numbers.items']) == range(5000)
+    assert not router.errors
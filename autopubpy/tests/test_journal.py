@@ -0,0 +1,54 @@
+from __future__ import unicode_literals
+import os
+import autopubpy.models
+from autopubpy.journal import Journal
+from autopubpy.loopback import LoopbackRouter
+
+
+def test_restart_restores_state_and_oplog(tmpdir):
+    path = str(tmpdir.join('colors'))
+    router = LoopbackRouter()
+    journal = Journal(path, compact_every=5)
+    main = autopubpy.models.SyncList(name='colors')
+    assert journal.attach(main) is None
+    main.set_main_session(router.session())
+    replica = autopubpy.models.SyncList(name='colors')
+    replica.set_client_session(router.session())
+    for number in range(12):
+        main.append(number)
+    del main[0]
+    version = main.version
+    journal.close()
+    next(main.subscribers).leave()
+    with open(journal.journal_path, 'ab') as handle:
+        handle.write(b'\x40\x00\x00\x00partial')
+
+    restarted = autopubpy.models.SyncList(name='colors')
+    journal = Journal(path, compact_every=5)
+    assert journal.attach(restarted) == version
+    assert list(restarted) == list(main)
+    assert journal.records == 3
+    published = router.published
+    restarted.set_main_session(router.session())
+    assert router.published == published
+    restarted.append('red')
+    assert list(replica) == list(restarted)
+    assert 'state' not in restarted.sync_since(version - 2)
+    journal.close()
+
+
+def test_load_state_compacts(tmpdir):
+    path = str(tmpdir.join('numbers'))
+    journal = Journal(path)
+    main = autopubpy.models.SyncDict({'a': 1}, name='numbers')
+    journal.attach(main)
+    main['b'] = 2
+    main.set_json('{"c": 3}')
+    main.broadcast_sync()
+    assert journal.records == 0
+    assert os.path.exists(journal.snapshot_path)
+    journal.close()
+    restored = autopubpy.models.SyncDict(name='numbers')
+    Journal(path).attach(restored)
+    assert dict(restored) == {'c': 3}
+    assert restored.version == main.version
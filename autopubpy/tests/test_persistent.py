@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+import json
+import random
+import autopubpy.models
+from autopubpy.loopback import LoopbackRouter
+from autopubpy.models.persistent import PersistentMap, PersistentVector, diff
+
+
+class SmallVector(PersistentVector):
+    chunk_size = 4
+
+
+class BadHash(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return len(self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, BadHash) and self.name == other.name
+
+
+def test_vector_matches_list():
+    rng = random.Random(3)
+    vector, expected, versions = SmallVector(range(10)), list(range(10)), []
+    for step in range(400):
+        action = rng.random()
+        if action < 0.3 or not expected:
+            index = rng.randint(-len(expected) - 1, len(expected) + 1)
+            vector.insert(index, step)
+            expected.insert(index, step)
+        elif action < 0.5:
+            index = rng.randrange(len(expected))
+            del vector[index]
+            del expected[index]
+        elif action < 0.7:
+            index = rng.randrange(len(expected))
+            vector[index] = expected[index] = -step
+        elif action < 0.8:
+            vector.extend([step] * 5)
+            expected.extend([step] * 5)
+        else:
+            versions.append((vector.freeze(), list(expected)))
+        assert len(vector) == len(expected)
+    assert list(vector) == expected
+    assert vector == expected
+    for frozen, items in versions:
+        assert list(frozen) == items
+        assert frozen[len(items) // 2:] == items[len(items) // 2:]
+    vector.sort()
+    vector.reverse()
+    assert list(vector) == sorted(expected, reverse=True)
+    del vector[:]
+    assert not vector
+
+
+def test_vector_diff():
+    vector = SmallVector(range(100))
+    before = vector.freeze()
+    vector[50] = 'x'
+    vector.insert(51, 'y')
+    start, stop, items = diff(before, vector.freeze())
+    assert (start, stop, items) == (50, 51, ['x', 'y'])
+    after = list(before)
+    after[start:stop] = items
+    assert after == list(vector)
+    assert diff(vector.freeze(), vector.freeze()) == (101, 101, [])
+
+
+def test_map_matches_dict():
+    rng = random.Random(5)
+    keys = [BadHash(name) for name in ('a', 'b', 'ab', 'cd', 'abc')] + list(range(300))
+    mapping, expected, versions = PersistentMap(), {}, []
+    for step in range(2000):
+        key = rng.choice(keys)
+        if rng.random() < 0.35 and key in expected:
+            del mapping[key]
+            del expected[key]
+        else:
+            mapping[key] = expected[key] = step
+        if step % 100 == 0:
+            versions.append((mapping.freeze(), dict(expected)))
+        assert len(mapping) == len(expected)
+    assert dict(mapping.items()) == expected
+    for frozen, items in versions:
+        assert dict(frozen.items()) == items
+    old, old_items = versions[-1]
+    changed, removed = diff(old, mapping.freeze())
+    assert set(removed) == set(old_items) - set(expected)
+    assert changed == dict((key, value) for key, value in expected.items()
+                           if old_items.get(key, object()) != value)
+
+
+def test_persistent_factories_replicate():
+    router = LoopbackRouter()
+    main = autopubpy.models.SyncList(['red'], list_factory=PersistentVector, name='colors')
+    main.set_main_session(router.session())
+    replica = autopubpy.models.SyncList(list_factory=PersistentVector, name='colors')
+    replica.set_client_session(router.session())
+    main.extend(['green', 'blue'])
+    del main[0]
+    assert list(replica) == ['green', 'blue']
+    assert isinstance(replica._container, PersistentVector)
+    numbers = autopubpy.models.SyncDict({'a': 1}, dict_factory=PersistentMap, name='numbers')
+    frozen = numbers._snapshot_container('json')
+    numbers['b'] = 2
+    assert dict(frozen) == {'a': 1}
+    assert json.loads(numbers.dump_state()) == {'a': 1, 'b': 2}
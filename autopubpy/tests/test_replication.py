@@ -0,0 +1,525 @@
+from __future__ import unicode_literals
+import pytest
+from autobahn.wamp.message import check_or_raise_uri
+from twisted.internet import defer, task
+import autopubpy.models
+from autopubpy.hub import PublisherHub
+from autopubpy.loopback import LoopbackRouter
+from autopubpy.models.persistent import PersistentVector
+from autopubpy.pubsub import attach_clients
+
+
+def connect(router, cls=autopubpy.models.SyncList, clients=2, name='colors', data=None):
+    main = cls(data, name=name)
+    main.set_main_session(router.session())
+    replicas = [cls(name=name) for _ in range(clients)]
+    for replica in replicas:
+        replica.set_client_session(router.session())
+    return main, replicas
+
+
+def test_list_replication():
+    router = LoopbackRouter()
+    main, replicas = connect(router, data=['red'])
+    main.append('green')
+    main.insert(0, 'blue')
+    del main[1]
+    replicas[0].append('black')
+    main.sort()
+    for replica in replicas:
+        assert list(replica) == list(main) == ['black', 'blue', 'green']
+    assert not router.errors
+
+
+def test_dict_replication():
+    router = LoopbackRouter()
+    main, replicas = connect(router, autopubpy.models.SyncOrderedDict, data={'a': 1})
+    main['b'] = [1, 2]
+    with main.batch():
+        main['c'] = 3
+        del main['a']
+    for replica in replicas:
+        assert list(replica.items()) == list(main.items())
+
+
+def test_bulk_operations_publish_once():
+    router = LoopbackRouter()
+    main_list, list_replicas = connect(router, data=range(5))
+    main_dict, dict_replicas = connect(router, autopubpy.models.SyncDict, name='numbers')
+    published = router.published
+    main_list.extend(number for number in range(5, 10))
+    main_list += [10]
+    main_list.reverse()
+    main_list.remove(3)
+    main_list.pop()
+    main_dict.update({'a': 1}, b=2)
+    main_dict.update([('c', 3)])
+    main_dict.pop('a')
+    assert router.published - published == 8
+    for replica in list_replicas:
+        assert list(replica) == list(main_list)
+    for replica in dict_replicas:
+        assert dict(replica) == dict(main_dict) == {'b': 2, 'c': 3}
+    main_list.clear()
+    main_dict.clear()
+    assert router.published - published == 10
+    assert list(list_replicas[0]) == [] and dict(dict_replicas[0]) == {}
+
+
+def test_nested_models_publish_paths():
+    router = LoopbackRouter()
+    main, replicas = connect(router, autopubpy.models.SyncDict, name='shop')
+    orders = autopubpy.models.SyncList()
+    main['orders'] = orders
+    for replica in replicas:
+        assert replica.as_json() == main.as_json()
+    orders.extend([autopubpy.models.SyncDict({'qty': 1}) for _ in range(20)])
+    published = router.published
+    main['orders'][17]['qty'] = 5
+    orders.insert(0, {'qty': 0})
+    assert router.published - published == 2
+    topic, = set(subscription.topic for subscription in router._subscriptions)
+    assert topic == main.uri
+    for replica in replicas:
+        assert replica['orders'][18] == {'qty': 5}
+        assert replica.as_json() == main.as_json()
+
+    del main['orders']
+    orders.append({'qty': 2})
+    assert router.published - published == 3
+    assert 'orders' not in replicas[0]
+
+
+def test_array_replication():
+    router = LoopbackRouter()
+    main, replicas = connect(router, autopubpy.models.SyncArray, name='telemetry',
+                             data=[0.0] * 8)
+    main[2:5] = [1.5, 2.5, 3.5]
+    main[-1] = 9.0
+    main.extend([10.0, 11.0])
+    del main[0]
+    main.insert(0, -1.0)
+    for replica in replicas:
+        assert replica[:] == main[:]
+        assert replica.typecode == 'd'
+    assert main.dump_state() == replicas[0].dump_state()
+
+
+def test_nested_array_replication():
+    router = LoopbackRouter()
+    main = autopubpy.models.SyncDict(name='series')
+    main['a'] = autopubpy.models.SyncArray([1.0, 2.0])
+    main.set_main_session(router.session())
+    fetched = autopubpy.models.SyncDict(name='series')
+    fetched.set_client_session(router.session())
+    main['b'] = autopubpy.models.SyncArray([0, 1, 2], typecode='i')
+    for series in (main['a'], main['b']):
+        series[0] = 7
+        series.extend([8, 9])
+        del series[1]
+        series.insert(0, -1)
+    assert main.as_json() == fetched.as_json()
+    assert fetched['b'] == [-1, 7, 2, 8, 9]
+    assert not router.errors
+
+
+def test_nested_counter_and_set_replication():
+    router = LoopbackRouter()
+    main, replicas = connect(router, autopubpy.models.SyncDict, name='stats')
+    main['hits'] = autopubpy.models.SyncCounter(5)
+    main['tags'] = autopubpy.models.SyncSet()
+    board = autopubpy.models.SyncList(name='board')
+    board.set_main_session(router.session())
+    fetched = autopubpy.models.SyncList(name='board')
+    fetched.set_client_session(router.session())
+    board.append(autopubpy.models.SyncCounter())
+    main['hits'].increment(2)
+    main['hits'].decrement()
+    main['tags'].update(['red', 'green'])
+    main['tags'].add('blue')
+    main['tags'].discard('red')
+    board[0].increment(3)
+    late = autopubpy.models.SyncDict(name='stats')
+    late.set_client_session(router.session())
+    main['tags'] -= ['green']
+    for replica in replicas + [late]:
+        assert replica['hits'] == 6
+        assert sorted(replica['tags']) == ['blue']
+        assert replica.version == main.version
+    assert list(fetched) == [3]
+    assert not router.errors
+
+
+class ChunkedArray(autopubpy.models.SyncArray):
+    chunk_size = 3
+
+
+def test_array_chunked_transfer():
+    router = LoopbackRouter()
+    main = autopubpy.models.SyncArray(range(10), typecode='i', name='counts')
+    main.set_main_session(router.session())
+    replica = ChunkedArray(typecode='i', name='counts')
+    replica.set_client_session(router.session())
+    assert replica[:] == main[:]
+    default = ChunkedArray(name='counts')
+    default.set_client_session(router.session())
+    assert default.typecode == 'i'
+    mismatched = autopubpy.models.SyncArray([float(n) for n in range(10)], name='counts')
+    mismatched._subscribe_events(router.session())
+    mismatched._authoritative = False
+    main.extend([10, 11])
+    main[0] = -1
+    for copy in (replica, default, mismatched):
+        assert copy.typecode == 'i'
+    assert mismatched[:] == default[:] == replica[:] == main[:]
+    assert not router.errors
+
+
+class ChunkedList(autopubpy.models.SyncList):
+    chunk_size = 3
+
+
+@pytest.mark.parametrize('list_factory, transfers', [(list, 2), (PersistentVector, 1)])
+def test_chunked_transfer_while_changing(list_factory, transfers):
+    clock = task.Clock()
+    router = LoopbackRouter(latency=1.0, clock=clock)
+    main = autopubpy.models.SyncList(range(10), list_factory=list_factory, name='numbers')
+    main.set_main_session(router.session())
+    replica = ChunkedList(name='numbers')
+    replica.set_client_session(router.session())
+    clock.advance(1.0)
+    clock.advance(1.0)
+    assert len(main._transfers) == 1
+    main.append(10)
+    clock.pump([1.0] * 10)
+    assert list(replica) == list(main)
+    assert replica.version == main.version
+    assert next(main._transfer_ids) == transfers + 1
+    assert not main._transfers
+
+
+def test_conflation():
+    clock = task.Clock()
+    router = LoopbackRouter()
+    main, replicas = connect(router, autopubpy.models.SyncDict, name='prices')
+    main.conflate_interval = 0.1
+    main.clock = clock
+    published = router.published
+    for price in range(100):
+        main['a'] = price
+        main['b'] = -price
+    assert router.published == published
+    assert 'a' not in replicas[0]
+    clock.advance(0.1)
+    assert router.published - published == 2
+    assert dict(replicas[0]) == {'a': 99, 'b': -99}
+
+    main['a'] = 100
+    del main['a']
+    assert router.published - published == 4
+    assert dict(replicas[0]) == {'b': -99}
+    assert not clock.getDelayedCalls()
+
+
+def test_conflation_normalizes_indices():
+    clock = task.Clock()
+    router = LoopbackRouter()
+    main, replicas = connect(router, data=list('abcde'))
+    main.conflate_interval = 0.1
+    main.clock = clock
+    published = router.published
+    main[4] = 'B'
+    main[1] = 'x'
+    main[-1] = 'C'
+    main.insert(0, 'y')
+    assert router.published - published == 3
+    main[-4] = 'z'
+    clock.advance(0.1)
+    assert router.published - published == 4
+    for replica in replicas:
+        assert list(replica) == list(main) == ['y', 'a', 'z', 'c', 'd', 'C']
+
+
+@pytest.mark.parametrize('policy, drained, dropped, resyncs', [
+    ('block', 2, 0, 0),
+    ('drop_oldest', 0, 2, 0),
+    ('resync', 0, 0, 1),
+])
+def test_publish_queue(policy, drained, dropped, resyncs):
+    clock = task.Clock()
+    router = LoopbackRouter()
+    main, replicas = connect(router, data=[])
+    main.clock = clock
+    main.publish_queue_size = 3
+    main.overflow_policy = policy
+    main.drain_size = 2
+    sync_topic = main.uri + '.sync_since'
+    syncs = router.calls[sync_topic]
+    main.extend([0, 1])
+    main.extend([2])
+    main.extend([3])
+    main.extend([4, 5])
+    main.extend([6])
+    stats = main.publish_queue_stats
+    assert (stats['drained'], stats['dropped'], stats['resyncs']) == (drained, dropped, resyncs)
+    assert stats['depth'] == (2 if policy == 'resync' else 3)
+    assert replicas[0].version < main.version
+    clock.advance(0)
+    assert main.publish_queue_stats['depth'] == 0
+    assert not clock.getDelayedCalls()
+    for replica in replicas:
+        assert list(replica) == list(main)
+        assert replica.version == main.version
+    resynced = len(replicas) if policy == 'drop_oldest' else 0
+    assert router.calls[sync_topic] - syncs == resynced
+
+
+def test_events_during_fetch_apply_once():
+    clock = task.Clock()
+    router = LoopbackRouter(latency=1.0, clock=clock)
+    main = autopubpy.models.SyncList(['red'], name='colors')
+    main.set_main_session(router.session())
+    clock.advance(1.0)
+    replica = autopubpy.models.SyncList(name='colors')
+    replica.set_client_session(router.session())
+    main.append('green')
+    clock.advance(0.5)
+    main.append('blue')
+    clock.pump([1.0] * 4)
+    assert list(replica) == ['red', 'green', 'blue']
+    assert replica.version == main.version
+
+
+def test_reconnect_fetches_missing_ops():
+    router = LoopbackRouter()
+    main, (replica,) = connect(router, clients=1, data=['red'])
+    session = next(replica.subscribers)
+    session.leave()
+    main.append('green')
+    replica.set_client_session(router.session())
+    assert list(replica) == ['red', 'green']
+    assert 'state' not in main.sync_since(replica.version - 1)
+
+
+def test_reconnect_after_client_changes():
+    router = LoopbackRouter()
+    main, (writer, reader) = connect(router, data=['red'])
+    writer.append('green')
+    writer[0] = 'black'
+    assert list(main) == list(reader) == ['black', 'green']
+    next(writer.subscribers).leave()
+    main.append('blue')
+    writer.set_client_session(router.session())
+    for replica in (writer, reader):
+        assert list(replica) == list(main) == ['black', 'green', 'blue']
+        assert replica.version == main.version == 4
+    main, (writer,) = connect(router, autopubpy.models.SyncCounter, clients=1, name='hits', data=5)
+    writer += 2
+    next(writer.subscribers).leave()
+    main.increment()
+    writer.set_client_session(router.session())
+    assert writer.value == main.value == 8
+    assert not router.errors
+
+
+def test_hub_multiplexes_objects():
+    router = LoopbackRouter()
+    hubs = [PublisherHub('com.shop') for _ in range(3)]
+    for index, hub in enumerate(hubs):
+        for number in range(50):
+            data = {'number': number} if index == 0 else None
+            hub.add(autopubpy.models.SyncDict(data, base_uri='com.shop', name='item{}'.format(number)))
+    hubs[0].set_main_session(router.session())
+    for hub in hubs[1:]:
+        hub.set_client_session(router.session())
+    assert len(router._subscriptions) == 3
+    assert list(router._registrations) == ['com.shop.hub.sync']
+    hubs[0]['com.shop.item7']['price'] = 3
+    hubs[1]['com.shop.item8']['price'] = 4
+    assert router.published == 3
+    for hub in hubs[1:]:
+        assert dict(hub['com.shop.item7']) == {'number': 7, 'price': 3}
+        assert dict(hub['com.shop.item8']) == {'number': 8, 'price': 4}
+        assert hub['com.shop.item7'].version == hubs[0]['com.shop.item7'].version
+        assert hub['com.shop.item8'].version == hubs[0]['com.shop.item8'].version
+    assert not router.errors
+
+
+def test_attach_clients_in_one_round_trip():
+    clock = task.Clock()
+    router = LoopbackRouter(latency=1.0, clock=clock)
+    main_session = router.session()
+    hub = PublisherHub('com.shop')
+    names = ['list{}'.format(number) for number in range(20)]
+    for name in names:
+        autopubpy.models.SyncList([name], name=name).set_main_session(main_session)
+    for number in range(10):
+        hub.add(autopubpy.models.SyncDict({'number': number}, base_uri='com.shop',
+                                          name='item{}'.format(number)))
+    hub.set_main_session(main_session)
+    clock.advance(1.0)
+    client_hub = PublisherHub('com.shop')
+    for number in range(10):
+        client_hub.add(autopubpy.models.SyncDict(base_uri='com.shop', name='item{}'.format(number)))
+    replicas = [autopubpy.models.SyncList(name=name) for name in names]
+    attached = attach_clients(router.session(), replicas + list(client_hub))
+    clock.advance(1.0)
+    assert len(attached.result) == 30
+    assert [list(replica) for replica in replicas] == [[name] for name in names]
+    assert client_hub['com.shop.item3']['number'] == 3
+    assert not router.errors
+
+
+def test_sharded_dict_publishes_one_shard():
+    router = LoopbackRouter()
+    main = autopubpy.models.ShardedSyncDict(dict(('key{}'.format(n), n) for n in range(40)),
+                                            shard_count=4, name='big')
+    main.set_main_session(router.session())
+    replica = autopubpy.models.ShardedSyncDict(shard_count=4, name='big')
+    replica.set_client_session(router.session())
+    assert [shard.uri for shard in replica.shards][:2] == ['com.big.shard0', 'com.big.shard1']
+    assert dict(replica) == dict(main)
+    published = router.published
+    main['key3'] = 'three'
+    del main['key4']
+    assert router.published - published == 2
+    assert all(len(shard) for shard in main.shards)
+    main.update(('new{}'.format(n), n) for n in range(10))
+    assert router.published - published <= 2 + 4
+    assert dict(replica) == dict(main)
+    assert len(replica) == 49
+    assert [dict(shard) for shard in main.shards] == [dict(shard) for shard in replica.shards]
+    assert len(main.snapshot()) == 4
+
+
+class KeyedDict(autopubpy.models.SyncDict):
+    key_topics = True
+
+
+def test_partial_replicas_receive_their_keys():
+    router = LoopbackRouter()
+    main, (full,) = connect(router, KeyedDict, clients=1, name='users',
+                            data=dict(('user{}'.format(n), n) for n in range(20)))
+    prefixed = KeyedDict(name='users', key_filter='user1')
+    prefixed.set_client_session(router.session())
+    picked = KeyedDict(name='users', key_filter=['user2', 'user3'])
+    picked.set_client_session(router.session())
+    assert sorted(prefixed) == ['user1'] + ['user1{}'.format(n) for n in range(10)]
+    assert dict(picked) == {'user2': 2, 'user3': 3}
+    delivered = router.delivered
+    main['user5'] = 'five'
+    assert router.delivered - delivered == 1
+    main['user3'] = 'three'
+    picked['user2'] = 'two'
+    del main['user12']
+    main.update({'user4': 4, 'user13': 13})
+    assert 'user4' not in picked and 'user4' not in prefixed
+    assert dict(picked) == {'user2': 'two', 'user3': 'three'}
+    assert dict(prefixed) == dict((key, value) for key, value in main.items()
+                                  if key.startswith('user1'))
+    assert dict(full) == dict(main)
+    assert main['user2'] == 'two'
+    assert not router.errors
+
+
+def test_key_topics_escape_keys():
+    router = LoopbackRouter()
+    keys = ['a b', '#', '', 'a.b', 'ab', '\xe9t\xe9']
+    main, (full,) = connect(router, KeyedDict, clients=1, name='users')
+    prefixed = KeyedDict(name='users', key_filter='a')
+    prefixed.set_client_session(router.session())
+    picked = KeyedDict(name='users', key_filter=['', 'a.b'])
+    picked.set_client_session(router.session())
+    for number, key in enumerate(keys):
+        main[key] = number
+    for key in keys:
+        check_or_raise_uri(main._key_topic(key))
+    assert dict(full) == dict(main)
+    assert dict(prefixed) == {'a b': 0, 'a.b': 3, 'ab': 4}
+    assert dict(picked) == {'': 2, 'a.b': 3}
+    assert full.version == main.version
+
+
+class CompressedList(autopubpy.models.SyncList):
+    compression = 'zlib'
+    compression_threshold = 256
+
+
+def test_compressed_payloads():
+    router = LoopbackRouter()
+    main, (replica,) = connect(router, CompressedList, clients=1, data=['red'] * 500)
+    assert list(replica) == list(main)
+    stats = main.compression_stats
+    assert stats['payloads'] == 1 and stats['ratio'] < 0.1
+    sync = main._sync_args(None)
+    assert not isinstance(main.sync_since(*sync)['state'], dict)
+    assert isinstance(main.sync_since(*sync, accept_encodings=['lz4', 'zlib'])['state'], dict)
+    main.extend(['green'] * 100)
+    main.append('blue')
+    assert main.compression_stats['payloads'] == 2
+    assert list(replica) == list(main)
+    assert replica.compression_stats['decompress_seconds'] > 0
+    replica.extend(['white'] * 100)
+    assert replica.compression_stats['payloads'] == 1
+    assert main.compression_stats['payloads'] == 3
+    old_client = CompressedList(name='colors')
+    old_client.accept_encodings = ()
+    old_client.set_client_session(router.session())
+    main.extend(['black'] * 100)
+    assert main.compression_stats['payloads'] == 3
+    assert list(old_client) == list(replica) == list(main)
+    assert not router.errors
+
+
+class ManualPool(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def run(self, func, *args):
+        deferred = defer.Deferred()
+        self.calls.append((deferred, func, args))
+        return deferred
+
+    def release(self):
+        calls, self.calls = self.calls, []
+        for deferred, func, args in calls:
+            deferred.callback(func(*args))
+
+
+def test_snapshots_encoded_in_pool():
+    pool = ManualPool()
+    router = LoopbackRouter()
+    main = autopubpy.models.SyncOrderedDict([('a', 1), ('b', 2)], name='letters')
+    main.snapshot_pool = pool
+    main.set_main_session(router.session())
+    main['a'] = 0
+    replicas = [autopubpy.models.SyncOrderedDict(name='letters') for _ in range(2)]
+    for replica in replicas:
+        replica.snapshot_pool = pool
+        replica.set_client_session(router.session())
+    assert len(pool.calls) == 1
+    main['c'] = 3
+    del main['a']
+    pool.release()
+    assert len(pool.calls) == 2
+    assert main.snapshot_stats['cached'] == []
+    pool.release()
+    for replica in replicas:
+        assert list(replica.items()) == list(main.items()) == [('b', 2), ('c', 3)]
+        assert replica.version == main.version
+    assert main.snapshot_stats['hits'] == 1
+
+
+def test_dropped_events():
+    router = LoopbackRouter(drop_rate=0.5, seed=1)
+    main, replicas = connect(router, clients=4)
+    for number in range(20):
+        main.append(number)
+    assert router.dropped
+    assert router.delivered + router.dropped == 20 * 4
+    router.drop_rate = 0.0
+    main.append(20)
+    for replica in replicas:
+        assert list(replica) == list(main)
+        assert replica.version == main.version
@@ -1,6 +1,8 @@
 ﻿from __future__ import unicode_literals
 import pytest
+import autopubpy.instrumentation
 import autopubpy.models
+import autopubpy.serialization
 
 def test_offline_one():
     test_list = autopubpy.models.SyncList()
@@ -8,6 +10,371 @@ def test_offline_one():
     test_ordereddict = autopubpy.models.SyncOrderedDict()
 
 
+class RecordingSession(object):
+    """Stands in for an ApplicationSession, records publishes and
+    calls registered procedures directly."""
+
+    def __init__(self, procedures=None):
+        self.published = []
+        self.calls = []
+        self.procedures = {} if procedures is None else procedures
+
+    def publish(self, topic, *args, **kwargs):
+        self.published.append((topic, args, kwargs))
+
+    def subscribe(self, handler, topic):
+        pass
+
+    def register(self, endpoint, procedure):
+        self.procedures[procedure] = endpoint
+
+    def call(self, procedure, *args, **kwargs):
+        self.calls.append(procedure)
+        return self.procedures[procedure](*args, **kwargs)
+
+
+def test_batch_publishes_once():
+    session = RecordingSession()
+    test_list = autopubpy.models.SyncList(name='colors')
+    test_list.subscribe(session)
+    with test_list.batch():
+        for color in ['red', 'green', 'blue']:
+            test_list.append(color)
+        test_list[0] = 'black'
+    assert len(session.published) == 1
+    topic, args, kwargs = session.published[0]
+    assert kwargs['op'] == test_list._op_codes['apply_batch']
+
+    replica = autopubpy.models.SyncList(name='colors')
+    replica._receive_sync_event(*args, **kwargs)
+    assert list(replica) == ['black', 'green', 'blue']
+
+
+def test_sync_since_returns_missing_ops():
+    main = autopubpy.models.SyncList(name='colors')
+    main.append('red')
+    replica = autopubpy.models.SyncList(name='colors')
+    replica._authoritative = False
+    replica._pending_events = []
+    replica._apply_sync(main.sync_since(None))
+    assert replica.version == main.version == 1
+
+    main.append('green')
+    main.append('blue')
+    result = main.sync_since(replica.version)
+    assert 'state' not in result
+    assert [op[0] for op in result['ops']] == [2, 3]
+    replica._apply_sync(result)
+    assert list(replica) == ['red', 'green', 'blue']
+    assert replica.version == 3
+
+
+class ShortLogList(autopubpy.models.SyncList):
+    oplog_size = 2
+
+
+def test_sync_since_falls_back_to_state():
+    main = ShortLogList(name='colors')
+    for color in ['red', 'green', 'blue']:
+        main.append(color)
+    result = main.sync_since(0)
+    assert 'ops' not in result
+    assert result['version'] == 3
+
+
+def test_codec_round_trip():
+    pytest.importorskip('msgpack')
+    main = autopubpy.models.SyncOrderedDict(codec='msgpack')
+    main['b'] = [1.5, 2.5]
+    main['a'] = {'nested': True}
+    replica = autopubpy.models.SyncOrderedDict(codec='msgpack')
+    replica.load_state(main.dump_state())
+    assert list(replica.items()) == list(main.items())
+    assert replica.as_json() == main.as_json()
+
+
+def test_array_binary_state():
+    pytest.importorskip('msgpack')
+    test_array = autopubpy.models.SyncArray([1.0, 2.0], codec='msgpack')
+    state = autopubpy.serialization.get_codec('msgpack').decode(test_array.dump_state())
+    assert state['data'] == test_array[:].tostring()
+    replica = autopubpy.models.SyncArray(codec='msgpack')
+    replica.load_state(test_array.dump_state())
+    assert replica[:] == test_array[:]
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        autopubpy.models.SyncList(codec='missing')
+
+
+def test_benchmark_codecs():
+    results = autopubpy.serialization.benchmark_codecs(range(100), number=1)
+    assert results['json']['size'] > 0
+
+
+def test_snapshot_cache():
+    test_list = autopubpy.models.SyncList([1, 2, 3])
+    first = test_list.as_json()
+    assert test_list.as_json() is first
+    test_list.append(4)
+    assert test_list.as_json() == '[1, 2, 3, 4]'
+    stats = test_list.snapshot_stats
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+class ChunkedDict(autopubpy.models.SyncOrderedDict):
+    chunk_size = 3
+
+
+def test_chunked_transfer():
+    main_session = RecordingSession()
+    main = autopubpy.models.SyncOrderedDict(name='letters')
+    for number, letter in enumerate('abcdefgh'):
+        main[letter] = number
+    main.set_main_session(main_session)
+
+    replica = ChunkedDict(name='letters')
+    replica.set_client_session(RecordingSession(main_session.procedures))
+    assert list(replica.items()) == list(main.items())
+    assert replica.version == main.version
+    assert not main._transfers
+
+
+def test_chunked_transfer_falls_back_to_snapshot():
+    main_session = RecordingSession()
+    main = autopubpy.models.SyncOrderedDict(name='letters')
+    for number, letter in enumerate('abcdefgh'):
+        main[letter] = number
+    main.set_main_session(main_session)
+    fetch_range = main_session.procedures['com.letters.fetch_range']
+
+    def fetch_while_changing(start, count, transfer):
+        main['z'] = start
+        return fetch_range(start, count, transfer)
+    main_session.procedures['com.letters.fetch_range'] = fetch_while_changing
+
+    client_session = RecordingSession(main_session.procedures)
+    replica = ChunkedDict(name='letters')
+    replica.set_client_session(client_session)
+    attempts = ChunkedDict.transfer_restarts + 1
+    assert client_session.calls.count('com.letters.fetch_range') == 2 * attempts
+    assert client_session.calls[-1] == 'com.letters.sync_since'
+    assert list(replica.items()) == list(main.items())
+    assert replica.version == main.version
+    assert not main._transfers
+
+
+def test_dispatch_table():
+    codes = autopubpy.models.SyncList._op_codes
+    assert set(codes) == set(['__delitem__', '__setitem__', '_extend',
+                              'apply_batch', 'apply_path',
+                              'clear', 'insert', 'load_state', 'pop', 'remove',
+                              'reverse', 'sort'])
+    replica = autopubpy.models.SyncList()
+    replica._receive_sync_event(0, 'red', op=codes['insert'])
+    replica._receive_sync_event(0, 'blue', method='__setitem__')
+    assert list(replica) == ['blue']
+    with pytest.raises(ValueError):
+        replica._receive_sync_event(op=len(codes))
+    with pytest.raises(KeyError):
+        replica._receive_sync_event(method='set_base_uri')
+
+
+class FailingSession(RecordingSession):
+
+    def publish(self, topic, *args, **kwargs):
+        raise RuntimeError("Cannot publish.")
+
+
+def test_instrumentation():
+    collector = autopubpy.instrumentation.MemoryCollector()
+    test_list = autopubpy.models.SyncList()
+    test_list.instrumentation = collector
+    session, failing_session = RecordingSession(), FailingSession()
+    test_list.subscribe(session)
+    test_list.subscribe(failing_session)
+    test_list.append('red')
+    test_list.sync_since()
+    metrics = collector.scrape(reset=True)
+    assert metrics['counters']['publishes'] == 1
+    assert metrics['counters']['publish_failures'] == 1
+    assert metrics['counters']['bytes'] == len('["red"]')
+    assert metrics['histograms']['apply_seconds']['count'] == 1
+    assert metrics['histograms']['fanout_seconds']['count'] == 1
+    assert collector.scrape() == {'counters': {}, 'histograms': {}}
+
+
+def test_failures_logged_by_default(caplog):
+    test_list = autopubpy.models.SyncList()
+    failing_session = FailingSession()
+    test_list.subscribe(failing_session)
+    test_list.append('red')
+    record, = [record for record in caplog.records
+               if record.name == 'autopubpy.instrumentation']
+    assert 'publish_failures' in record.getMessage()
+    assert 'Cannot publish.' in record.getMessage()
+
+
+class CountingCodec(autopubpy.serialization.JSONCodec):
+    name = 'counting'
+    encodes = 0
+
+    def encode(self, obj):
+        CountingCodec.encodes += 1
+        return super(CountingCodec, self).encode(obj)
+
+
+def test_shared_payload_encoded_once():
+    autopubpy.serialization.register_codec(CountingCodec())
+    test_list = autopubpy.models.SyncList(codec='counting')
+    sessions = [RecordingSession() for _ in range(5)]
+    for session in sessions:
+        test_list.subscribe(session)
+    test_list.append({'color': 'blue'})
+    assert CountingCodec.encodes == 0
+    assert 'packed' not in sessions[0].published.pop()[2]
+    for session in sessions[1:]:
+        del session.published[:]
+    test_list.share_payloads = True
+    test_list.append({'color': 'red'})
+    assert CountingCodec.encodes == 1
+    packed = [session.published[0][2]['packed'] for session in sessions]
+    assert all(payload is packed[0] for payload in packed)
+    replica = autopubpy.models.SyncList(codec='counting')
+    replica._receive_sync_event(*sessions[0].published[0][1], **sessions[0].published[0][2])
+    assert list(replica) == [{'color': 'red'}]
+
+
+class IndexedList(autopubpy.models.SyncList):
+    indexed = True
+
+
+def test_indexed_list():
+    session = RecordingSession()
+    main = IndexedList(['red', 'green', 'red'], name='colors')
+    main.subscribe(session)
+    replica = IndexedList(name='colors')
+    replica.load_state(main.snapshot())
+    expected = ['red', 'green', 'red']
+    assert main.index('green') == 1 and main.count('red') == 2
+    main.append('blue')
+    main[0] = 'green'
+    main.insert(1, ['unhashable'])
+    main.remove('red')
+    main.pop(0)
+    main.sort()
+    main.extend(['red', 'red'])
+    del main[-1]
+    expected.append('blue')
+    expected[0] = 'green'
+    expected.insert(1, ['unhashable'])
+    expected.remove('red')
+    expected.pop(0)
+    expected.sort()
+    expected.extend(['red', 'red'])
+    del expected[-1]
+    for topic, args, kwargs in session.published:
+        replica._receive_sync_event(*args, **kwargs)
+    for test_list in (main, replica):
+        assert list(test_list) == expected
+        for value in ['red', 'green', 'blue', 'black', ['unhashable']]:
+            assert (value in test_list) == (value in expected)
+            assert test_list.count(value) == expected.count(value)
+            if value in expected:
+                assert test_list.index(value) == expected.index(value)
+        with pytest.raises(ValueError):
+            test_list.index('black')
+    stats = main.index_stats
+    assert stats['values'] == 3 and stats['bytes'] > 0
+    assert autopubpy.models.SyncList().index_stats is None
+
+
+def test_indexed_list_assignment():
+    test_list = IndexedList(['red', 'green', 'blue'])
+    assert test_list.index('blue') == 2
+    test_list[1] = 'black'
+    assert test_list.index_stats['positions']
+    assert test_list.index('black') == 1
+    test_list.remove('black')
+    assert list(test_list) == ['red', 'blue']
+    assert test_list.index('blue') == 1
+    test_list[0] = 'blue'
+    assert test_list.index('blue') == 0 and 'red' not in test_list
+
+
+class UnscannableList(list):
+
+    def __iter__(self):
+        raise AssertionError("The list was scanned.")
+
+
+def test_child_key_without_scan():
+    parent = autopubpy.models.SyncList()
+    children = [autopubpy.models.SyncDict() for _ in range(5)]
+    parent.extend(children[:4])
+    parent.insert(-1, children[4])
+    parent[3], parent[4] = children[3], children[4]
+    assert [child._parent_key for child in children] == list(range(5))
+    container, parent._container = parent._container, UnscannableList(parent._container)
+    assert parent._child_key(children[4]) == 4
+    parent._container = container
+    parent.insert(0, autopubpy.models.SyncDict())
+    assert parent._child_key(children[4]) == 5
+    assert children[4]._parent_key == 5
+
+
+def deliver(session, *targets):
+    for topic, args, kwargs in session.published:
+        for target in targets:
+            target._receive_sync_event(*args, **kwargs)
+    del session.published[:]
+
+
+def test_counter_increments_commute():
+    sessions = [RecordingSession() for _ in range(3)]
+    counters = [autopubpy.models.SyncCounter(5, name='hits') for _ in sessions]
+    for counter, session in zip(counters, sessions):
+        counter.subscribe(session)
+    for counter in counters[1:]:
+        counter._authoritative = False
+    counters[0].increment(2)
+    counters[1] += 3
+    counters[2].decrement()
+    deliver(sessions[2], counters[1], counters[0])
+    deliver(sessions[1], counters[2], counters[0])
+    deliver(sessions[0], counters[1], counters[2])
+    assert [counter.value for counter in counters] == [9, 9, 9]
+    assert [counter.version for counter in counters] == [3, 3, 3]
+    assert not any(counter._originated for counter in counters)
+    replica = autopubpy.models.SyncCounter(name='hits')
+    replica.load_state(counters[0].snapshot())
+    assert replica == counters[0]
+
+
+def test_set_add_wins_over_concurrent_discard():
+    sessions = [RecordingSession() for _ in range(2)]
+    sets = [autopubpy.models.SyncSet(name='tags') for _ in sessions]
+    for sync_set, session in zip(sets, sessions):
+        sync_set.subscribe(session)
+    sets[1]._authoritative = False
+    sets[0].update(['red', 'green', 'blue'])
+    deliver(sessions[0], sets[1])
+    sets[0].discard('red')
+    sets[1].add('red')
+    sets[1] -= ['green']
+    deliver(sessions[0], sets[1])
+    deliver(sessions[1], sets[0])
+    deliver(sessions[0], sets[1])
+    assert set(sets[0]) == set(sets[1]) == {'red', 'blue'}
+    assert sets[1].version == sets[0].version == 4
+    replica = autopubpy.models.SyncSet(name='tags')
+    replica.load_state(sets[0].snapshot())
+    assert replica == {'red', 'blue'}
+    replica.clear()
+    assert len(replica) == 0
+
+
 """
 class TestSession(ApplicationSession):
 